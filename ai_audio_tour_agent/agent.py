@@ -1,9 +1,71 @@
 """AI Agent definitions using Google Gemini"""
+import threading
+from contextlib import contextmanager
+from os import getenv
+from typing import Any, Dict, Iterator, List, Tuple
+from uuid import uuid4
+
+import google.generativeai as genai
 from phi.agent import Agent
 from phi.model.google import Gemini
-from phi.tools.googlesearch import GoogleSearch
 from config import config
 from printer import printer
+from search_cache import CachedGoogleSearch, LocalSearchBackend, SearchCache, google_backend
+
+# Gemini model behind every agent; also part of the research cache key
+MODEL_ID = "gemini-2.5-flash"
+
+_genai_lock = threading.Lock()
+_genai_params = None
+
+def configure_genai(**client_params):
+    """Configure the Gemini SDK, but only when its settings actually change
+    
+    ``genai.configure`` throws away the SDK's cached client (and with it the
+    open HTTP connections), so calling it on every request as phi's Gemini
+    model does means a new connection per model call.
+    """
+    global _genai_params
+    with _genai_lock:
+        if client_params != _genai_params:
+            genai.configure(**client_params)
+            _genai_params = client_params
+
+class PooledGemini(Gemini):
+    """Gemini model that shares one configured SDK client across all agents"""
+    
+    def get_client(self) -> genai.GenerativeModel:
+        if self.client:
+            return self.client
+        # Resolve settings the way phi's Gemini.get_client does
+        self.api_key = self.api_key or getenv("GOOGLE_API_KEY")
+        if not self.api_key:
+            printer.print_error("GOOGLE_API_KEY not set. Please set the GOOGLE_API_KEY environment variable.")
+        client_params: Dict[str, Any] = {"api_key": self.api_key}
+        if self.client_params:
+            client_params.update(self.client_params)
+        configure_genai(**client_params)
+        # Cheap: the GenerativeModel wraps the SDK's shared client
+        return genai.GenerativeModel(model_name=self.id, **self.request_kwargs)
+
+# Every specialist searches through one cache, so repeated queries (within a
+# tour or across tours) cost a single round-trip. Made-up local results are
+# never written to disk, where later Google-backed runs would find them
+local_search = config.search_backend == "local"
+search_cache = SearchCache(
+    backend=LocalSearchBackend() if local_search else google_backend,
+    ttl=config.search_cache_ttl,
+    max_entries=config.search_cache_max_entries,
+    path=None if local_search else config.search_cache_path or None,
+)
+
+def create_search_tool() -> CachedGoogleSearch:
+    """Create the web search tool given to the specialists"""
+    return CachedGoogleSearch(search_cache)
+
+def create_model() -> Gemini:
+    """Create the Gemini model used by every agent"""
+    return PooledGemini(id=MODEL_ID, api_key=config.get_gemini_api_key())
 
 def create_planner_agent() -> Agent:
     """Create the planner agent that allocates time for different interests"""
@@ -11,7 +73,7 @@ def create_planner_agent() -> Agent:
     
     return Agent(
         name="Tour Planner",
-        model=Gemini(id="gemini-2.5-flash", api_key=config.get_gemini_api_key()),
+        model=create_model(),
         description="Plans the tour structure and time allocation based on user interests",
         instructions=[
             "You are a tour planning expert.",
@@ -30,8 +92,8 @@ def create_architecture_agent() -> Agent:
     
     return Agent(
         name="Architecture Specialist",
-        model=Gemini(id="gemini-2.5-flash", api_key=config.get_gemini_api_key()),
-        tools=[GoogleSearch()],
+        model=create_model(),
+        tools=[create_search_tool()],
         description="Expert in architectural history, styles, and building design",
         instructions=[
             "You are an architecture expert and historian.",
@@ -51,8 +113,8 @@ def create_history_agent() -> Agent:
     
     return Agent(
         name="History Specialist",
-        model=Gemini(id="gemini-2.5-flash", api_key=config.get_gemini_api_key()),
-        tools=[GoogleSearch()],
+        model=create_model(),
+        tools=[create_search_tool()],
         description="Expert in historical events, figures, and cultural heritage",
         instructions=[
             "You are a history expert and storyteller.",
@@ -72,8 +134,8 @@ def create_culinary_agent() -> Agent:
     
     return Agent(
         name="Culinary Specialist",
-        model=Gemini(id="gemini-2.5-flash", api_key=config.get_gemini_api_key()),
-        tools=[GoogleSearch()],
+        model=create_model(),
+        tools=[create_search_tool()],
         description="Expert in local cuisine, food culture, and culinary traditions",
         instructions=[
             "You are a culinary expert and food culture specialist.",
@@ -93,8 +155,8 @@ def create_culture_agent() -> Agent:
     
     return Agent(
         name="Culture Specialist",
-        model=Gemini(id="gemini-2.5-flash", api_key=config.get_gemini_api_key()),
-        tools=[GoogleSearch()],
+        model=create_model(),
+        tools=[create_search_tool()],
         description="Expert in local culture, traditions, arts, and social customs",
         instructions=[
             "You are a cultural anthropologist and local culture expert.",
@@ -114,7 +176,7 @@ def create_orchestrator_agent() -> Agent:
     
     return Agent(
         name="Tour Orchestrator",
-        model=Gemini(id="gemini-2.5-flash", api_key=config.get_gemini_api_key()),
+        model=create_model(),
         description="Combines all research into a cohesive, engaging audio tour narrative",
         instructions=[
             "You are a professional tour guide and storyteller.",
@@ -139,3 +201,87 @@ def get_all_agents() -> dict:
         "Culinary": create_culinary_agent,
         "Culture": create_culture_agent,
     }
+
+def get_agent_factories() -> dict:
+    """Get the factory for every agent role, specialists keyed by interest"""
+    return {
+        "Planner": create_planner_agent,
+        "Orchestrator": create_orchestrator_agent,
+        **get_all_agents(),
+    }
+
+def reset_agent(agent: Agent):
+    """Forget everything from the agent's previous run before it is reused
+    
+    Only the memory, session and per-run model state are cleared. The model
+    keeps its registered tools: ``Agent.new_session`` would also clear them,
+    and Gemini then registers its function declarations a second time.
+    """
+    if agent.memory is not None:
+        agent.memory.clear()
+    agent.session_id = str(uuid4())
+    agent.run_id = None
+    agent.run_response = None
+    if agent.model is not None:
+        agent.model.metrics = {}
+        agent.model.function_call_stack = None
+
+class AgentPool:
+    """Process-wide pool of idle agents, so tours reuse agents and their clients
+    
+    Agents aren't safe to share between concurrent runs, so each ``acquire``
+    hands out an agent nobody else is using (building one if none is idle)
+    and takes it back afterwards. Everything built with an old API key is
+    dropped as soon as ``config.set_gemini_api_key`` changes the key.
+    """
+    
+    def __init__(self, max_idle_per_role: int = 4):
+        self.max_idle_per_role = max_idle_per_role
+        self.created = 0
+        self.reused = 0
+        self._idle: Dict[str, List[Agent]] = {}
+        self._api_key = None
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def acquire(self, role: str) -> Iterator[Agent]:
+        """Borrow a fresh-state agent for ``role`` (e.g. "Planner", "History")"""
+        agent, api_key = self._checkout(role)
+        try:
+            yield agent
+        finally:
+            self._checkin(role, agent, api_key)
+    
+    def _checkout(self, role: str) -> Tuple[Agent, str]:
+        api_key = config.get_gemini_api_key()
+        with self._lock:
+            if api_key != self._api_key:
+                self._idle.clear()
+                self._api_key = api_key
+            idle = self._idle.get(role)
+            if idle:
+                self.reused += 1
+                return idle.pop(), api_key
+            self.created += 1
+        factories = get_agent_factories()
+        if role not in factories:
+            raise KeyError(f"Unknown agent role: {role}")
+        return factories[role](), api_key
+    
+    def _checkin(self, role: str, agent: Agent, api_key: str):
+        reset_agent(agent)
+        with self._lock:
+            idle = self._idle.setdefault(role, [])
+            if api_key == self._api_key and len(idle) < self.max_idle_per_role:
+                idle.append(agent)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "idle": {role: len(agents) for role, agents in self._idle.items()},
+            }
+
+# Global agent pool instance
+agent_pool = AgentPool()
@@ -1,10 +1,14 @@
 """AI Audio Tour Agent - Streamlit Application"""
 import streamlit as st
-import os
+import queue
+import threading
+from typing import Iterator, List, Tuple
 from gtts import gTTS
+from agent import AgentPool, agent_pool
 from config import config
-from manager import create_tour_manager
+from manager import TourManager, create_tour_manager
 from printer import printer
+import tts
 
 # Page configuration
 st.set_page_config(
@@ -62,6 +66,84 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Streamlit re-runs this script on every interaction, so anything expensive
+# is cached: a rerun that changes no inputs does no model, TTS or file work
+TOUR_CACHE_TTL = "1d"
+TOUR_CACHE_MAX_ENTRIES = 100
+AUDIO_CACHE_MAX_ENTRIES = 8
+
+@st.cache_resource
+def get_agent_pool() -> AgentPool:
+    """The agent pool, shared by every rerun and session"""
+    return agent_pool
+
+@st.cache_resource
+def get_tour_manager() -> TourManager:
+    """One TourManager for every session (it keeps no per-tour state)"""
+    return create_tour_manager(get_agent_pool())
+
+@st.cache_resource
+def get_tts_loop():
+    """The one long-lived event loop that runs Edge TTS"""
+    return tts.start_event_loop()
+
+@st.cache_data(ttl=TOUR_CACHE_TTL, max_entries=TOUR_CACHE_MAX_ENTRIES, show_spinner=False)
+def finished_tour(location: str, interests: Tuple[str, ...], duration: int, _events: queue.Queue) -> str:
+    """
+    The tour for these inputs, generated only if it isn't cached yet
+    
+    While generating, progress and text events are put on ``_events`` (the
+    leading underscore keeps it out of the cache key). Nothing is put there
+    on a cache hit.
+    """
+    tour = ""
+    for event in get_tour_manager().stream_tour(location, list(interests), duration):
+        if event["type"] == "done":
+            tour = event["tour"]
+        else:
+            _events.put(event)
+    return tour
+
+def stream_tour(location: str, interests: List[str], duration: int) -> Iterator[dict]:
+    """
+    Events for a tour, as from ``TourManager.stream_tour``, via ``finished_tour``
+    
+    Generation runs on a worker thread and its events are relayed as they
+    arrive; drawing them from inside the cached function would get the whole
+    stream replayed on every cache hit. A cached tour arrives as one text event.
+    """
+    events = queue.Queue()
+    outcome = {}
+    
+    def run():
+        try:
+            outcome["tour"] = finished_tour(" ".join(location.split()), tuple(interests), duration, events)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            events.put(None)
+    
+    threading.Thread(target=run, name="tour", daemon=True).start()
+    streamed = False
+    while (event := events.get()) is not None:
+        streamed = streamed or event["type"] == "text"
+        yield event
+    if "error" in outcome:
+        raise outcome["error"]
+    if not streamed:
+        yield {"type": "progress", "step": "cached", "message": "Loaded the saved tour for these choices"}
+        yield {"type": "text", "delta": outcome["tour"]}
+    yield {"type": "done", "tour": outcome["tour"]}
+
+@st.cache_data(max_entries=AUDIO_CACHE_MAX_ENTRIES, show_spinner=False)
+def audio_bytes(audio_key: str) -> bytes:
+    """The MP3 stored under ``audio_key`` in the audio cache, read from disk once"""
+    audio_path = tts.audio_cache.get(audio_key)
+    if audio_path is None:
+        raise FileNotFoundError("The audio is no longer cached; generate it again")
+    with open(audio_path, "rb") as audio_file:
+        return audio_file.read()
+
 def main():
     """Main application function"""
     
@@ -170,8 +252,8 @@ def main():
     # Initialize session state
     if 'tour_content' not in st.session_state:
         st.session_state.tour_content = None
-    if 'audio_path' not in st.session_state:
-        st.session_state.audio_path = None
+    if 'audio_key' not in st.session_state:
+        st.session_state.audio_key = None
     
     # Generate tour button
     st.divider()
@@ -185,26 +267,37 @@ def main():
             st.error("❌ Please select at least one interest!")
             return
         
-        # Generate tour
-        with st.spinner(f"🔄 Generating your {duration}-minute tour of {location}..."):
-            try:
-                # Create tour manager
-                manager = create_tour_manager()
-                
-                # Generate tour
-                tour_content = manager.generate_tour(
-                    location=location,
-                    interests=interests,
-                    duration=duration
-                )
-                
-                # Save to session state
-                st.session_state.tour_content = tour_content
-                st.session_state.audio_path = None  # Reset audio when new tour generated
-                
-            except Exception as e:
-                st.error(f"❌ Error generating tour: {str(e)}")
-                printer.print_error(str(e))
+        # Generate tour, showing the script as it is written
+        status = st.status(f"🔄 Generating your {duration}-minute tour of {location}...", expanded=True)
+        script = st.empty()
+        try:
+            events = stream_tour(
+                location=location,
+                interests=interests,
+                duration=duration
+            )
+            
+            def script_deltas():
+                # Progress goes to the status box; script text goes to the page
+                for event in events:
+                    if event["type"] == "progress":
+                        status.write(event["message"])
+                    elif event["type"] == "text":
+                        yield event["delta"]
+                    elif event["type"] == "done":
+                        status.update(label="✅ Tour script ready", state="complete", expanded=False)
+                        st.session_state.tour_content = event["tour"]
+                        st.session_state.audio_key = None  # Reset audio when new tour generated
+            
+            with script.container():
+                st.write_stream(script_deltas())
+            # The finished tour is rendered below with the rest of the page
+            script.empty()
+            
+        except Exception as e:
+            status.update(label="❌ Tour generation failed", state="error")
+            st.error(f"❌ Error generating tour: {str(e)}")
+            printer.print_error(str(e))
 
     # Display Tour Content (if exists in session state)
     if st.session_state.tour_content:
@@ -282,6 +375,10 @@ def main():
         # Generate Audio Button
         st.markdown("### 🎬 Generate")
         col1, col2 = st.columns(2)
+        # One player slot: the opening plays here while the rest is synthesized
+        # and keeps playing until the listener asks for the full tour
+        player = st.empty()
+        previewed = False
         
         with col1:
             # Download text
@@ -298,62 +395,83 @@ def main():
             if st.button("🎙️ Generate Audio", use_container_width=True, type="primary"):
                 with st.spinner("🔄 Converting text to speech..."):
                     try:
-                        # Create audio directory
-                        audio_dir = "audio_tours"
-                        os.makedirs(audio_dir, exist_ok=True)
-                        
-                        # Generate audio filename
-                        audio_filename = f"{location.replace(' ', '_')}_tour.mp3"
-                        audio_path = os.path.join(audio_dir, audio_filename)
-                        
                         if "Edge TTS" in voice_engine:
-                            # Use Edge TTS for high-quality voices
-                            import asyncio
-                            import edge_tts
-                            
                             # Extract voice ID from selection
-                            voice_id = voice_name.split(" (")[0]
-                            
-                            # Calculate rate for edge-tts
-                            rate_percent = int((speech_rate - 1.0) * 100)
-                            rate_str = f"{rate_percent:+d}%"
+                            engine, voice_id = "edge", voice_name.split(" (")[0]
+                        else:
+                            engine, voice_id = "gtts", "en"
+                        
+                        # Audio is cached by a hash of everything that shapes it
+                        cache_key = tts.audio_cache.key(tour_content, engine, voice_id, speech_rate)
+                        
+                        if tts.audio_cache.get(cache_key) is None:
+                            if engine == "edge":
+                                # Use Edge TTS for high-quality voices, on the shared event loop
+                                synthesize = tts.edge_synthesizer(voice_id, speech_rate, get_tts_loop())
+                            else:
+                                # Use Google TTS (gTTS)
+                                synthesize = tts.gtts_synthesizer(speech_rate)
                             
-                            async def generate_edge_audio():
-                                communicate = edge_tts.Communicate(
-                                    tour_content, 
-                                    voice_id,
-                                    rate=rate_str
+                            # Synthesize the script in chunks, several at once; the
+                            # opening plays while the rest is still being synthesized
+                            chunks = tts.split_script(tour_content, config.get_tts_chunk_chars())
+                            progress = st.progress(0.0, text="Synthesizing audio...")
+                            parts = []
+                            for part in tts.iter_speech(chunks, synthesize, config.get_tts_concurrency()):
+                                parts.append(part)
+                                if len(parts) == 1 and len(chunks) > 1:
+                                    with player.container():
+                                        st.caption("▶️ The opening is ready; the rest is on its way")
+                                        st.audio(part, format='audio/mp3', autoplay=True)
+                                    previewed = True
+                                progress.progress(
+                                    len(parts) / len(chunks),
+                                    text=f"Synthesized {len(parts)} of {len(chunks)} parts"
                                 )
-                                await communicate.save(audio_path)
-                            
-                            # Run async function
-                            asyncio.run(generate_edge_audio())
+                            progress.empty()
                             
+                            # MP3 frames from each part join into one file as they are
+                            tts.audio_cache.put(cache_key, b"".join(parts))
+                            st.success(f"✅ Audio generated successfully with {voice_engine}!")
                         else:
-                            # Use Google TTS (gTTS)
-                            from gtts import gTTS
-                            slow_speech = speech_rate < 0.9
-                            tts = gTTS(text=tour_content, lang='en', slow=slow_speech)
-                            tts.save(audio_path)
+                            st.success("✅ Same script and voice as before, so the saved audio is ready")
                         
-                        # Save audio path to session state
-                        st.session_state.audio_path = audio_path
-                        st.success(f"✅ Audio generated successfully with {voice_engine}!")
+                        # Save audio key to session state
+                        st.session_state.audio_key = cache_key
                         
                     except Exception as audio_error:
                         st.error(f"❌ Error generating audio: {str(audio_error)}")
                         st.info("💡 Try using Google TTS if Edge TTS fails")
 
         # Display Audio Player (if audio exists in session state)
-        if st.session_state.audio_path and os.path.exists(st.session_state.audio_path):
-            st.audio(st.session_state.audio_path, format='audio/mp3')
-            
-            # Download audio button
-            with open(st.session_state.audio_path, 'rb') as audio_file:
+        if st.session_state.audio_key:
+            try:
+                audio = audio_bytes(st.session_state.audio_key)
+            except FileNotFoundError as missing:
+                st.session_state.audio_key = None
+                player.empty()
+                st.warning(f"⚠️ {missing}")
+            else:
+                if previewed:
+                    # Swapping players now would cut the opening off; the full
+                    # tour takes over on the rerun this button starts
+                    st.button(
+                        "▶️ Play the Full Tour (restarts from the beginning)",
+                        on_click=lambda: st.session_state.update(autoplay_tour=True),
+                        use_container_width=True
+                    )
+                else:
+                    player.audio(
+                        audio,
+                        format='audio/mp3',
+                        autoplay=st.session_state.pop('autoplay_tour', False)
+                    )
+                
+                # Download audio button
                 st.download_button(
                     label="📥 Download Audio (MP3)",
-                    data=audio_file,
-                    file_name=os.path.basename(st.session_state.audio_path),
+                    data=audio,
+                    file_name=f"{location.replace(' ', '_')}_tour.mp3",
                     mime="audio/mp3",
                     use_container_width=True
                 )
@@ -0,0 +1,101 @@
+"""Content-addressed disk cache of synthesized tour audio for AI Audio Tour Agent"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+class AudioCache:
+    """MP3 files named by a hash of everything that determines their audio
+
+    Identical requests share one file, so replaying or regenerating audio
+    that hasn't changed is instant, and different tours never overwrite each
+    other. An in-memory index (rebuilt from the directory on start) tracks
+    sizes and recency; once the files add up to more than ``max_bytes``, the
+    least recently used are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            if not name.endswith(".mp3"):
+                continue
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+        self.total_bytes = sum(self._index.values())
+
+    @staticmethod
+    def key(text: str, engine: str, voice: str, rate: float) -> str:
+        """Cache key for a script read by ``voice`` of ``engine`` at ``rate``"""
+        payload = json.dumps([text, engine, voice, round(rate, 2)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the path of cached audio, or None if there is none"""
+        path = self.path(key)
+        with self._lock:
+            if key in self._index and os.path.exists(path):
+                self._index.move_to_end(key)
+                self.hits += 1
+            else:
+                # Deleted from disk behind our back (or never cached)
+                self.total_bytes -= self._index.pop(key, 0)
+                self.misses += 1
+                return None
+        try:
+            # Keep recency across restarts, when the index is rebuilt from mtimes
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """Store audio and return its path, evicting least recently used files"""
+        path = self.path(key)
+        # Write to a private name first so readers never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            doomed = []
+            while self.total_bytes > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self.total_bytes -= size
+                doomed.append(old_key)
+        for old_key in doomed:
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+        return path
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._index),
+                "bytes": self.total_bytes,
+            }
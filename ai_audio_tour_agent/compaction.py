@@ -0,0 +1,156 @@
+"""Token-budgeted compaction of specialist research for AI Audio Tour Agent"""
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+# Rough size of a token in English text; close enough to budget a prompt
+CHARS_PER_TOKEN = 4
+# No interest is squeezed below this, however little time the plan gives it
+MIN_INTEREST_TOKENS = 150
+# Sentences sharing this much of their vocabulary (Jaccard) say the same thing
+DUPLICATE_SIMILARITY = 0.7
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+# A full stop after one of these (or an initial) doesn't end the sentence
+ABBREVIATIONS = frozenset(["st", "mt", "mr", "mrs", "ms", "dr", "no", "vs", "etc", "e.g", "i.e", "c", "ca"])
+MINUTES = re.compile(r"(\d+(?:\.\d+)?)\s*(?:-|–|to)?\s*(?:\d+(?:\.\d+)?\s*)?(?:min|minutes?)\b", re.IGNORECASE)
+MARKDOWN_PREFIX = re.compile(r"^\s*(?:#{1,6}\s+|[-*+•]\s+|\d+[.)]\s+|>\s*)")
+WORD = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset("""
+    a about above after again all also an and any are as at be because been before being below between
+    both but by can could did do does doing down during each few for from further had has have having he
+    her here hers him his how i if in into is it its itself just like many me more most much my no nor
+    not now of off on once one only or other our ours out over own same she should so some such than
+    that the their theirs them then there these they this those through to too under until up upon us
+    very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of ``text``"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def parse_allocation(time_allocation: str, interests: List[str]) -> Dict[str, float]:
+    """
+    Minutes the planner gave each interest
+
+    Looks for the first line naming an interest that also states minutes
+    ("History: 4 minutes", "2. Culinary (3-4 min)"). Interests the plan
+    doesn't price get the average of the rest, or 1 each if none are priced.
+    """
+    lines = time_allocation.splitlines()
+    minutes: Dict[str, float] = {}
+    for interest in interests:
+        for line in lines:
+            if interest.lower() not in line.lower():
+                continue
+            match = MINUTES.search(line)
+            if match:
+                minutes[interest] = float(match.group(1))
+                break
+    default = sum(minutes.values()) / len(minutes) if minutes else 1.0
+    return {interest: minutes.get(interest) or default for interest in interests}
+
+def interest_budgets(total_tokens: int, minutes: Dict[str, float]) -> Dict[str, int]:
+    """Split ``total_tokens`` between interests in proportion to their minutes"""
+    total_minutes = sum(minutes.values()) or 1.0
+    return {
+        interest: max(int(total_tokens * share / total_minutes), MIN_INTEREST_TOKENS)
+        for interest, share in minutes.items()
+    }
+
+def _words(text: str) -> List[str]:
+    return [word for word in WORD.findall(text.lower()) if len(word) > 2 and word not in STOPWORDS]
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _sentences(content: str) -> List[Tuple[int, str]]:
+    """``(line number, sentence)`` for each sentence, with Markdown list and heading markers removed"""
+    sentences = []
+    for number, line in enumerate(content.splitlines()):
+        line = MARKDOWN_PREFIX.sub("", line).replace("**", "").strip()
+        pending = ""
+        for piece in SENTENCE_BREAK.split(line):
+            pending = f"{pending} {piece}" if pending else piece
+            last_word = pending.rsplit(None, 1)[-1].rstrip(".").lower() if pending.strip() else ""
+            if last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha()):
+                continue
+            if pending.strip():
+                sentences.append((number, pending.strip()))
+            pending = ""
+        if pending.strip():
+            sentences.append((number, pending.strip()))
+    return sentences
+
+def compact_research(
+    research: Dict[str, str],
+    time_allocation: str,
+    total_tokens: int
+) -> Tuple[Dict[str, str], dict]:
+    """
+    Trim specialist research to fit ``total_tokens`` before orchestration
+
+    Each interest gets a share of the budget in proportion to the minutes
+    the plan gives it. Sentences that repeat one already kept (from this or
+    an earlier specialist) are dropped first; then, if an interest is still
+    over budget, its most informative sentences are kept, scored by how
+    often their words recur in that specialist's research (favouring
+    specifics such as numbers and dates), and put back in their original
+    order. Nothing is sent to a model.
+
+    Returns:
+        The compacted research, and counters: ``before_tokens``,
+        ``after_tokens``, ``duplicates`` (sentences dropped as repeats) and
+        ``trimmed`` (sentences dropped for the budget)
+    """
+    budgets = interest_budgets(total_tokens, parse_allocation(time_allocation, list(research)))
+    seen: List[Set[str]] = []
+    compacted: Dict[str, str] = {}
+    stats = {"before_tokens": 0, "after_tokens": 0, "duplicates": 0, "trimmed": 0}
+
+    for interest, content in research.items():
+        stats["before_tokens"] += estimate_tokens(content)
+        unique = []
+        for line, sentence in _sentences(content):
+            # Sentences with no content words (a bare heading) are compared verbatim
+            words = set(_words(sentence)) or {sentence.lower()}
+            if any(_similarity(words, other) >= DUPLICATE_SIMILARITY for other in seen):
+                stats["duplicates"] += 1
+                continue
+            seen.append(words)
+            unique.append((line, sentence))
+
+        kept = unique
+        if sum(estimate_tokens(sentence) + 1 for _, sentence in unique) > budgets[interest]:
+            frequency = Counter(_words(content))
+            scored = []
+            for index, (_, sentence) in enumerate(unique):
+                words = _words(sentence)
+                density = sum(frequency[word] for word in set(words)) / math.sqrt(len(words) + 1)
+                if re.search(r"\d", sentence):
+                    density *= 1.3
+                # Specialists tend to lead with what matters most
+                density *= 1.0 + 0.3 * (1 - index / len(unique))
+                scored.append((density, index))
+            chosen = set()
+            used = 0
+            for _, index in sorted(scored, reverse=True):
+                cost = estimate_tokens(unique[index][1]) + 1
+                if used + cost > budgets[interest]:
+                    continue
+                chosen.add(index)
+                used += cost
+            kept = [unique[index] for index in sorted(chosen)]
+            stats["trimmed"] += len(unique) - len(kept)
+
+        # Sentences from the same source line stay together as a paragraph
+        paragraphs: Dict[int, List[str]] = {}
+        for line, sentence in kept:
+            paragraphs.setdefault(line, []).append(sentence)
+        compacted[interest] = "\n".join(" ".join(sentences) for sentences in paragraphs.values())
+        stats["after_tokens"] += estimate_tokens(compacted[interest])
+
+    return compacted, stats
@@ -10,6 +10,37 @@ class Config:
     
     def __init__(self):
         self.gemini_api_key = os.getenv("GEMINI_API_KEY", "")
+        # How many specialists research at once, and how long each may take
+        self.specialist_concurrency = int(os.getenv("SPECIALIST_CONCURRENCY", "4"))
+        self.specialist_timeout = float(os.getenv("SPECIALIST_TIMEOUT", "120"))
+        # Pipelining starts the specialists without waiting for the planner; an
+        # interest the plan gives this many times an even share is researched again
+        self.pipeline_research = os.getenv("PIPELINE_RESEARCH", "true").lower() in ("1", "true", "yes")
+        self.refine_ratio = float(os.getenv("REFINE_RATIO", "2"))
+        # Specialist research is cached on disk and reused for repeat tours
+        self.research_cache_path = os.getenv(
+            "RESEARCH_CACHE_PATH",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "research_cache.sqlite3")
+        )
+        self.research_cache_ttl = float(os.getenv("RESEARCH_CACHE_TTL_HOURS", "168")) * 3600
+        self.research_cache_max_entries = int(os.getenv("RESEARCH_CACHE_MAX_ENTRIES", "2000"))
+        self.research_cache_max_bytes = int(float(os.getenv("RESEARCH_CACHE_MAX_MB", "50")) * 1024 * 1024)
+        # Web searches are shared by all specialists; set a path to keep them on disk too
+        self.search_backend = os.getenv("SEARCH_BACKEND", "google").lower()
+        self.search_cache_ttl = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "24")) * 3600
+        self.search_cache_max_entries = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+        self.search_cache_path = os.getenv("SEARCH_CACHE_PATH", "")
+        # Research is trimmed to about this many tokens before the orchestrator sees it (0 = off)
+        self.context_token_budget = int(os.getenv("ORCHESTRATOR_CONTEXT_TOKENS", "4000"))
+        # Audio is synthesized in chunks of about this many characters, several at once
+        self.tts_concurrency = int(os.getenv("TTS_CONCURRENCY", "4"))
+        self.tts_chunk_chars = int(os.getenv("TTS_CHUNK_CHARS", "1500"))
+        # Synthesized audio is kept on disk, named by a hash of text and voice settings
+        self.audio_cache_dir = os.getenv(
+            "AUDIO_CACHE_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_tours")
+        )
+        self.audio_cache_max_bytes = int(float(os.getenv("AUDIO_CACHE_MAX_MB", "500")) * 1024 * 1024)
         
     def get_gemini_api_key(self) -> str:
         """Get Gemini API key"""
@@ -19,6 +50,34 @@ class Config:
         """Set Gemini API key"""
         self.gemini_api_key = api_key
     
+    def get_specialist_concurrency(self) -> int:
+        """Get the maximum number of specialists researching at once"""
+        return max(self.specialist_concurrency, 1)
+    
+    def get_specialist_timeout(self) -> float:
+        """Get the per-specialist research timeout in seconds"""
+        return self.specialist_timeout
+    
+    def is_pipelined(self) -> bool:
+        """Check if specialists start researching before the plan is ready"""
+        return self.pipeline_research
+    
+    def get_refine_ratio(self) -> float:
+        """Get how far above an even share an interest's time must be to refine its research (0 = never)"""
+        return max(self.refine_ratio, 0.0)
+    
+    def get_context_token_budget(self) -> int:
+        """Get the token budget for research in the orchestrator prompt (0 disables trimming)"""
+        return max(self.context_token_budget, 0)
+    
+    def get_tts_concurrency(self) -> int:
+        """Get the maximum number of text chunks synthesized at once"""
+        return max(self.tts_concurrency, 1)
+    
+    def get_tts_chunk_chars(self) -> int:
+        """Get the target size of each text chunk sent for synthesis"""
+        return max(self.tts_chunk_chars, 100)
+    
     def is_configured(self) -> bool:
         """Check if Gemini API key is configured"""
         return bool(self.gemini_api_key)
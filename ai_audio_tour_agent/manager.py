@@ -1,20 +1,48 @@
 """Tour orchestration logic for AI Audio Tour Agent"""
-from typing import List, Dict
-from agent import (
-    create_planner_agent,
-    create_orchestrator_agent,
-    get_all_agents
-)
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+from agent import MODEL_ID, AgentPool, agent_pool, get_all_agents
+from compaction import compact_research, estimate_tokens, parse_allocation
+from config import config
 from printer import printer
+from research_cache import ResearchCache
+
+# Shared by every TourManager in the process
+research_cache = ResearchCache(
+    path=config.research_cache_path,
+    ttl=config.research_cache_ttl,
+    max_entries=config.research_cache_max_entries,
+    max_bytes=config.research_cache_max_bytes,
+)
+
+# Research is cached per model, and apart for each non-Google search backend so
+# research built on made-up offline results is never served for real tours
+RESEARCH_MODEL = MODEL_ID if config.search_backend == "google" else f"{MODEL_ID}+{config.search_backend}"
+
+# Progress messages for each research outcome from ``TourManager.iter_research``
+RESEARCH_MESSAGES = {
+    "cached": "{interest}: using cached research",
+    "done": "{interest}: research complete ({seconds:.0f}s)",
+    "failed": "{interest}: research failed, continuing without it",
+    "timeout": "{interest}: research timed out after {seconds:.0f}s, continuing without it",
+}
+
+# Progress messages for each outcome from ``TourManager.iter_refinement``
+REFINEMENT_MESSAGES = {
+    "cached": "{interest}: using cached research for this plan",
+    "done": "{interest}: research deepened to fit the plan ({seconds:.0f}s)",
+    "failed": "{interest}: deeper research failed, keeping the first pass",
+    "timeout": "{interest}: deeper research timed out, keeping the first pass",
+}
 
 class TourManager:
     """Manages the tour generation process"""
-    
-    def __init__(self):
-        self.planner = None
-        self.orchestrator = None
-        self.specialists = {}
-    
+
+    def __init__(self, pool: AgentPool = agent_pool):
+        # Agents are borrowed from the pool for each run and handed back after
+        self.pool = pool
+
     def generate_tour(
         self,
         location: str,
@@ -32,45 +60,364 @@ class TourManager:
         Returns:
             Complete tour narrative as a string
         """
+        final_tour = ""
+        for event in self.stream_tour(location, interests, duration):
+            if event["type"] == "done":
+                final_tour = event["tour"]
+        return final_tour
+    
+    def stream_tour(
+        self,
+        location: str,
+        interests: List[str],
+        duration: int
+    ) -> Iterator[dict]:
+        """
+        Generate a tour, yielding events as it goes
+        
+        Events are dicts with a ``type``:
+            - ``"progress"``: ``step`` and ``message`` for each stage and specialist
+            - ``"text"``: ``delta``, the next piece of the orchestrator's script
+            - ``"done"``: ``tour``, the complete script (always the last event)
+        
+        Args:
+            location: The city, landmark, or location to tour
+            interests: List of interest areas (Architecture, History, Culinary, Culture)
+            duration: Tour duration in minutes
+        """
         try:
             printer.print_header(f"Generating Tour for {location}")
             
-            # Step 1: Create planner and get time allocation
+            # Step 1: Create planner and get time allocation. When pipelining,
+            # the planner runs alongside the specialists and its plan is only
+            # needed once the script is written
+            pipelined = config.is_pipelined()
             printer.print_step("Step 1", "Planning tour structure...")
-            self.planner = create_planner_agent()
+            yield {"type": "progress", "step": "planning", "message": "Planning tour structure..."}
+            planner_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="planner")
+            try:
+                planned = planner_executor.submit(self._plan, location, interests, duration)
+                time_allocation = None if pipelined else planned.result()
+                
+                # Step 2: Get specialist content for each interest, all at once
+                printer.print_step("Step 2", "Gathering specialist content...")
+                yield {"type": "progress", "step": "research", "message": "Gathering specialist content..."}
+                specialist_content = {}
+                for status, interest, content, seconds in self.iter_research(
+                    location, interests, duration, time_allocation
+                ):
+                    if content is not None:
+                        specialist_content[interest] = content
+                    yield {
+                        "type": "progress",
+                        "step": "research",
+                        "message": RESEARCH_MESSAGES[status].format(interest=interest, seconds=seconds),
+                    }
+                
+                if pipelined:
+                    time_allocation = planned.result()
+                    yield {"type": "progress", "step": "planning", "message": "Tour plan ready"}
+                    # Research that was written without the plan may be far too
+                    # thin for an interest the plan gives much more time
+                    for status, interest, content, seconds in self.iter_refinement(
+                        location, interests, duration, time_allocation
+                    ):
+                        if content is not None:
+                            specialist_content[interest] = content
+                        yield {
+                            "type": "progress",
+                            "step": "research",
+                            "message": REFINEMENT_MESSAGES[status].format(interest=interest, seconds=seconds),
+                        }
+            finally:
+                planner_executor.shutdown(wait=False)
             
-            planning_prompt = f"""
-            Create a time allocation plan for a {duration}-minute audio tour of {location}.
+            requested = [interest for interest in interests if interest in get_all_agents()]
+            if requested and not specialist_content:
+                raise RuntimeError("All specialist research failed")
+            # Present research in the order the interests were chosen
+            specialist_content = {
+                interest: specialist_content[interest] for interest in requested if interest in specialist_content
+            }
             
-            The tour should cover these interests: {', '.join(interests)}
+            # Step 3: Orchestrate final tour
+            printer.print_step("Step 3", "Creating final tour narrative...")
+            yield {"type": "progress", "step": "writing", "message": "Writing the tour script..."}
             
-            Provide a clear breakdown of:
-            1. How many minutes to allocate to each interest area
-            2. The order in which topics should be presented
-            3. Any special considerations for this location
+            missing = [i for i in requested if i not in specialist_content]
+            full_prompt = self._orchestration_prompt(
+                location, interests, duration, time_allocation, specialist_content, missing
+            )
             
-            Make sure the total time adds up to exactly {duration} minutes.
-            """
+            # Trim the research to a token budget split by the plan's timings
+            budget = config.get_context_token_budget()
+            if budget:
+                # The planner may come back empty; every interest then gets an even share
+                compacted, stats = compact_research(specialist_content, time_allocation or "", budget)
+                orchestration_prompt = self._orchestration_prompt(
+                    location, interests, duration, time_allocation, compacted, missing
+                )
+            else:
+                stats = {"duplicates": 0, "trimmed": 0}
+                orchestration_prompt = full_prompt
+            before, after = estimate_tokens(full_prompt), estimate_tokens(orchestration_prompt)
+            printer.print_info(
+                f"Orchestrator prompt: ~{before} -> ~{after} tokens "
+                f"({stats['duplicates']} repeated and {stats['trimmed']} low-value sentences dropped)"
+            )
+            yield {
+                "type": "progress",
+                "step": "writing",
+                "message": f"Condensed the orchestrator prompt from ~{before:,} to ~{after:,} tokens",
+            }
             
-            planning_response = self.planner.run(planning_prompt)
-            time_allocation = planning_response.content
+            # Stream the script out as the orchestrator writes it
+            parts = []
+            with self.pool.acquire("Orchestrator") as orchestrator:
+                for chunk in orchestrator.run(orchestration_prompt, stream=True):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield {"type": "text", "delta": chunk.content}
+            final_tour = "".join(parts)
             
-            printer.print_agent("Planner", f"Created time allocation plan:\n{time_allocation}")
+            printer.print_success(f"Tour generated successfully! ({len(final_tour)} characters)")
+            yield {"type": "done", "tour": final_tour}
             
-            # Step 2: Get specialist content for each interest
-            printer.print_step("Step 2", "Gathering specialist content...")
-            specialist_content = {}
-            available_agents = get_all_agents()
+        except Exception as e:
+            printer.print_error(f"Error generating tour: {str(e)}")
+            raise
+
+    def _plan(self, location: str, interests: List[str], duration: int) -> str:
+        """Ask the planner how to split the tour's time (in a worker thread)"""
+        started = time.monotonic()
+        planning_prompt = f"""
+        Create a time allocation plan for a {duration}-minute audio tour of {location}.
+        
+        The tour should cover these interests: {', '.join(interests)}
+        
+        Provide a clear breakdown of:
+        1. How many minutes to allocate to each interest area
+        2. The order in which topics should be presented
+        3. Any special considerations for this location
+        
+        Make sure the total time adds up to exactly {duration} minutes.
+        """
+        
+        with self.pool.acquire("Planner") as planner:
+            planning_response = planner.run(planning_prompt)
+        time_allocation = planning_response.content
+        
+        printer.print_agent("Planner", f"Created time allocation plan:\n{time_allocation}")
+        printer.print_timing("Planner", time.monotonic() - started)
+        return time_allocation
+
+    def iter_refinement(
+        self,
+        location: str,
+        interests: List[str],
+        duration: int,
+        time_allocation: Optional[str]
+    ) -> Iterator[Tuple[str, str, Optional[str], float]]:
+        """
+        Redo plan-free research for interests the plan turned out to favour heavily
+        
+        Pipelined research assumes every interest gets an even share of the
+        tour. An interest the plan gives at least ``config.get_refine_ratio()``
+        times that share is researched again with the plan in hand (a ratio
+        of 0 turns this off). Refined research is cached apart from the
+        plan-free research, keyed by the minutes the plan gave the interest, so
+        a repeat tour with the same split reuses it instead of refining again.
+        Yields like ``iter_research``.
+        """
+        ratio = config.get_refine_ratio()
+        requested = [interest for interest in interests if interest in get_all_agents()]
+        if not ratio or not requested:
+            return
+        even_share = duration / len(requested)
+        minutes = parse_allocation(time_allocation or "", requested)
+        underfed = [interest for interest in requested if minutes[interest] >= ratio * even_share]
+        if underfed:
+            printer.print_info(f"Refining research with the plan for: {', '.join(underfed)}")
+            variants = {interest: f"plan:{minutes[interest]:g}/{duration}min" for interest in underfed}
+            yield from self.iter_research(location, underfed, duration, time_allocation, variants)
+
+    def iter_research(
+        self,
+        location: str,
+        interests: List[str],
+        duration: int,
+        time_allocation: Optional[str],
+        cache_variants: Optional[Dict[str, str]] = None
+    ) -> Iterator[Tuple[str, str, Optional[str], float]]:
+        """
+        Run every requested specialist concurrently, yielding each outcome as it happens
+        
+        At most ``config.get_specialist_concurrency()`` specialists run at once,
+        and each gets ``config.get_specialist_timeout()`` seconds from when it
+        starts. A specialist that fails or times out is reported and left out,
+        so the tour is built from whatever research did come back. Research
+        is looked up in ``research_cache`` first and stored there afterwards,
+        under the interest's entry in ``cache_variants`` if it has one. Without a ``time_allocation`` the
+        specialists research without a plan.
+        
+        Yields:
+            ``(status, interest, content, seconds)`` where status is "cached",
+            "done", "failed" or "timeout" and content is None unless research
+            came back
+        """
+        available_agents = get_all_agents()
+        requested = [interest for interest in interests if interest in available_agents]
+        if not requested:
+            return
+        
+        timeout = config.get_specialist_timeout()
+        started_at: Dict[str, float] = {}
+        succeeded = 0
+        phase_start = time.monotonic()
+        
+        # Research from an earlier tour of the same place needs no agent at all
+        variants = cache_variants or {}
+        to_research = []
+        for interest in requested:
+            cached = research_cache.get(location, interest, RESEARCH_MODEL, variants.get(interest, ""))
+            if cached is None:
+                to_research.append(interest)
+                continue
+            succeeded += 1
+            printer.print_agent(
+                f"{interest} Specialist",
+                f"Using cached research ({len(cached)} characters)"
+            )
+            yield "cached", interest, cached, 0.0
+        if not to_research:
+            printer.print_timing("Specialist research (all cached)", time.monotonic() - phase_start)
+            return
+        
+        executor = ThreadPoolExecutor(
+            max_workers=min(config.get_specialist_concurrency(), len(to_research)),
+            thread_name_prefix="specialist",
+        )
+        try:
+            futures = {}
+            for interest in to_research:
+                printer.print_info(f"Researching {interest}...")
+                prompt = self._research_prompt(location, interest, duration, time_allocation)
+                future = executor.submit(self._run_specialist, interest, prompt, started_at)
+                futures[future] = interest
             
-            for interest in interests:
-                if interest in available_agents:
-                    printer.print_info(f"Researching {interest}...")
+            pending = set(futures)
+            while pending:
+                # Wake up for the next result or the earliest deadline
+                now = time.monotonic()
+                deadlines = [started_at[futures[f]] + timeout for f in pending if futures[f] in started_at]
+                wait_for = max(min(deadlines) - now, 0) if deadlines else timeout
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    interest = futures[future]
+                    elapsed = time.monotonic() - started_at.get(interest, phase_start)
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        printer.print_error(f"{interest} Specialist failed after {elapsed:.1f}s: {e}")
+                        yield "failed", interest, None, elapsed
+                        continue
+                    succeeded += 1
+                    research_cache.put(location, interest, RESEARCH_MODEL, content, variants.get(interest, ""))
+                    printer.print_agent(
+                        f"{interest} Specialist",
+                        f"Research complete ({len(content)} characters)"
+                    )
+                    printer.print_timing(f"{interest} Specialist", elapsed)
+                    yield "done", interest, content, elapsed
+                
+                now = time.monotonic()
+                for future in list(pending):
+                    interest = futures[future]
+                    if interest in started_at and now - started_at[interest] >= timeout:
+                        # The thread can't be stopped, but nobody waits for it any more
+                        pending.discard(future)
+                        printer.print_error(f"{interest} Specialist timed out after {timeout:.0f}s")
+                        yield "timeout", interest, None, timeout
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        printer.print_timing(
+            f"Specialist research ({succeeded}/{len(requested)} succeeded)",
+            time.monotonic() - phase_start
+        )
+    
+    def _run_specialist(self, interest: str, prompt: str, started_at: Dict[str, float]) -> str:
+        """Run one specialist's research on a pooled agent (in a worker thread)"""
+        started_at[interest] = time.monotonic()
+        with self.pool.acquire(interest) as agent:
+            response = agent.run(prompt)
+        return response.content
+    
+    @staticmethod
+    def _orchestration_prompt(
+        location: str,
+        interests: List[str],
+        duration: int,
+        time_allocation: str,
+        specialist_content: Dict[str, str],
+        missing: List[str]
+    ) -> str:
+        """Build the orchestrator's prompt from the plan and the research"""
+        orchestration_prompt = f"""
+        Create a complete, engaging audio tour script for {location}.
+        
+        Duration: {duration} minutes
+        Interests covered: {', '.join(interests)}
+        
+        Time Allocation Plan:
+        {time_allocation}
+        
+        Specialist Content:
+        
+        """
+        
+        for interest, content in specialist_content.items():
+            orchestration_prompt += f"\n--- {interest} ---\n{content}\n"
+        
+        if missing:
+            orchestration_prompt += f"""
+        No research is available for: {', '.join(missing)}. Cover these briefly
+        from general knowledge, or leave them out if you are unsure of the facts.
+        """
+        
+        orchestration_prompt += f"""
+        
+        Your task:
+        1. Combine all this content into a single, flowing audio tour narrative
+        2. Create smooth transitions between topics
+        3. Start with a warm welcome and introduction to {location}
+        4. End with a memorable conclusion
+        5. Make it sound natural and engaging when read aloud
+        6. Ensure the pacing feels right for a {duration}-minute tour
+        7. Use a conversational, friendly tone throughout
+        
+        The final output should be a complete script ready to be read as an audio tour.
+        """
+        return orchestration_prompt
+    
+    @staticmethod
+    def _research_prompt(location: str, interest: str, duration: int, time_allocation: Optional[str]) -> str:
+        """Build the research prompt for one specialist (without a plan when pipelining)"""
+        if time_allocation is None:
+            return f"""
+                    Research and provide detailed, engaging content about {interest.lower()} 
+                    aspects of {location}.
                     
-                    # Create the specialist agent
-                    agent = available_agents[interest]()
+                    This content will be part of a {duration}-minute audio tour that also
+                    covers other topics, so focus on the most interesting and important
+                    information.
                     
-                    # Create research prompt
-                    research_prompt = f"""
+                    Provide rich, engaging content that would be interesting to hear in an 
+                    audio tour. Include specific facts, stories, and details that bring 
+                    the topic to life.
+                    """
+        return f"""
                     Research and provide detailed, engaging content about {interest.lower()} 
                     aspects of {location}.
                     
@@ -85,60 +432,7 @@ class TourManager:
                     audio tour. Include specific facts, stories, and details that bring 
                     the topic to life.
                     """
-                    
-                    response = agent.run(research_prompt)
-                    specialist_content[interest] = response.content
-                    
-                    printer.print_agent(
-                        f"{interest} Specialist",
-                        f"Research complete ({len(response.content)} characters)"
-                    )
-            
-            # Step 3: Orchestrate final tour
-            printer.print_step("Step 3", "Creating final tour narrative...")
-            self.orchestrator = create_orchestrator_agent()
-            
-            orchestration_prompt = f"""
-            Create a complete, engaging audio tour script for {location}.
-            
-            Duration: {duration} minutes
-            Interests covered: {', '.join(interests)}
-            
-            Time Allocation Plan:
-            {time_allocation}
-            
-            Specialist Content:
-            
-            """
-            
-            for interest, content in specialist_content.items():
-                orchestration_prompt += f"\n--- {interest} ---\n{content}\n"
-            
-            orchestration_prompt += f"""
-            
-            Your task:
-            1. Combine all this content into a single, flowing audio tour narrative
-            2. Create smooth transitions between topics
-            3. Start with a warm welcome and introduction to {location}
-            4. End with a memorable conclusion
-            5. Make it sound natural and engaging when read aloud
-            6. Ensure the pacing feels right for a {duration}-minute tour
-            7. Use a conversational, friendly tone throughout
-            
-            The final output should be a complete script ready to be read as an audio tour.
-            """
-            
-            final_response = self.orchestrator.run(orchestration_prompt)
-            final_tour = final_response.content
-            
-            printer.print_success(f"Tour generated successfully! ({len(final_tour)} characters)")
-            
-            return final_tour
-            
-        except Exception as e:
-            printer.print_error(f"Error generating tour: {str(e)}")
-            raise
 
-def create_tour_manager() -> TourManager:
+def create_tour_manager(pool: AgentPool = agent_pool) -> TourManager:
     """Factory function to create a TourManager instance"""
-    return TourManager()
+    return TourManager(pool)
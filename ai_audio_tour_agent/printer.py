@@ -38,6 +38,11 @@ class Printer:
     def print_info(message: str):
         """Print an info message"""
         print(f"\nℹ️  INFO: {message}\n")
+    
+    @staticmethod
+    def print_timing(label: str, seconds: float):
+        """Print how long a step took"""
+        print(f"⏱️  {label}: {seconds:.1f}s")
 
 # Global printer instance
 printer = Printer()
@@ -0,0 +1,130 @@
+"""Persistent SQLite cache of specialist research for AI Audio Tour Agent"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+def normalize(text: str) -> str:
+    """Case-fold and collapse whitespace so "  rome" and "Rome" share a key"""
+    return " ".join(text.casefold().split())
+
+class ResearchCache:
+    """Specialist research keyed by (location, interest, model id)
+
+    A ``variant`` keeps research written for a particular purpose (such as
+    one tour plan) apart from the general entry for the same key.
+    Entries expire ``ttl`` seconds after they were researched. Once the cache
+    holds more than ``max_entries`` entries or ``max_bytes`` of text, the
+    least recently used entries are deleted. Each call opens its own
+    connection, so the cache can be used from the specialist threads and
+    shared by several app processes.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS research (
+                    location TEXT NOT NULL,
+                    interest TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (location, interest, model)
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS research_last_used ON research (last_used)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits on success and is always closed"""
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _key(location: str, interest: str, model: str, variant: str) -> Tuple[str, str, str]:
+        # The variant shares the model column, so existing cache files keep working
+        return normalize(location), normalize(interest), f"{model}|{variant}" if variant else model
+
+    def get(self, location: str, interest: str, model: str, variant: str = "") -> Optional[str]:
+        """Return cached research, or None if there is none or it has expired"""
+        key = self._key(location, interest, model, variant)
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT content FROM research "
+                "WHERE location = ? AND interest = ? AND model = ? AND created_at > ?",
+                (*key, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE research SET last_used = ? WHERE location = ? AND interest = ? AND model = ?",
+                    (now, *key),
+                )
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row[0] if row is not None else None
+
+    def put(self, location: str, interest: str, model: str, content: str, variant: str = ""):
+        """Store research, then evict expired and least recently used entries"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO research VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *self._key(location, interest, model, variant),
+                    content, len(content.encode("utf-8")), now, now,
+                ),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        db.execute("DELETE FROM research WHERE created_at <= ?", (now - self.ttl,))
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM research").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = db.execute("SELECT rowid, bytes FROM research ORDER BY last_used").fetchall()
+        doomed = []
+        for rowid, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((rowid,))
+            count -= 1
+            total -= size
+        db.executemany("DELETE FROM research WHERE rowid = ?", doomed)
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM research")
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM research").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": count,
+                "bytes": total,
+            }
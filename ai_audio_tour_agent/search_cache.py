@@ -0,0 +1,257 @@
+"""Shared, deduplicating web-search cache for AI Audio Tour Agent specialists"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from phi.tools.googlesearch import GoogleSearch
+
+# backend(query, max_results, language) -> [{"title", "url", "description"}, ...]
+SearchBackend = Callable[[str, int, str], List[Dict[str, str]]]
+
+QUERY_WORD = re.compile(r"[\w']+")
+# Words that don't change what a search engine returns. Prepositions such as
+# "to" and "from" are kept: they decide what the query is about
+QUERY_STOPWORDS = frozenset(["a", "an", "the", "&"])
+
+def normalize_query(query: str) -> str:
+    """Case-fold and drop punctuation and articles, keeping word order
+
+    "History of Rome", "the history of  Rome" and "HISTORY OF ROME?" share
+    one key; "flights from Paris to Rome" and "flights from Rome to Paris" don't.
+    """
+    words = [word for word in QUERY_WORD.findall(query.casefold()) if word not in QUERY_STOPWORDS]
+    return " ".join(words) or " ".join(query.casefold().split())
+
+def google_backend(query: str, max_results: int, language: str) -> List[Dict[str, str]]:
+    """Search Google the way phi's ``GoogleSearch`` tool does"""
+    from googlesearch import search
+    from pycountry import pycountry
+
+    # Resolve language to ISO 639-1 code if needed
+    if len(language) != 2:
+        try:
+            language = pycountry.languages.lookup(language).alpha_2
+        except LookupError:
+            language = "en"
+    return [
+        {"title": result.title, "url": result.url, "description": result.description}
+        for result in search(query, num_results=max_results, lang=language, advanced=True)
+    ]
+
+class LocalSearchBackend:
+    """Offline stand-in for Google: made-up but stable results for any query
+
+    Each result is derived from the query, so the same query always gets the
+    same answer. ``latency`` seconds are slept per call to mimic a real
+    round-trip, and ``calls`` counts the searches that reached the backend.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, query: str, max_results: int, language: str) -> List[Dict[str, str]]:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        slug = "-".join(QUERY_WORD.findall(query.casefold())) or "search"
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        return [
+            {
+                "title": f"{query.strip()} ({index + 1})",
+                "url": f"https://example.com/{language}/{slug}/{digest}-{index + 1}",
+                "description": f"Offline stand-in result {index + 1} for \"{query.strip()}\".",
+            }
+            for index in range(max_results)
+        ]
+
+class SearchCache:
+    """Search results shared by every specialist, in memory and optionally on disk
+
+    Queries are keyed by ``normalize_query`` and language. A cached answer
+    with at least as many results as asked for is reused (sliced down if
+    needed). Entries live ``ttl`` seconds in an LRU of ``max_entries``; with
+    a ``path``, they are also kept in SQLite, so they survive restarts and
+    are shared with other app processes. Concurrent searches for the same
+    key wait for a single backend call instead of each making their own.
+    """
+
+    def __init__(
+        self,
+        backend: SearchBackend,
+        ttl: float,
+        max_entries: int,
+        path: Optional[str] = None
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (created_at, max_results asked for, results), oldest first
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[float, int, List[Dict[str, str]]]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], Tuple[int, Future]] = {}
+        if path:
+            with self._connect() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS searches (
+                        query TEXT NOT NULL,
+                        language TEXT NOT NULL,
+                        max_results INTEGER NOT NULL,
+                        results TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (query, language)
+                    )
+                    """
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits on success and is always closed"""
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def search(self, query: str, max_results: int = 5, language: str = "en") -> List[Dict[str, str]]:
+        """Results for ``query``, from the cache when possible"""
+        key = (normalize_query(query), language.casefold())
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl and self._covers(entry[1], entry[2], max_results):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[2][:max_results]
+            flight = self._in_flight.get(key)
+            if flight is not None and flight[0] >= max_results:
+                self.coalesced += 1
+                leader = False
+                future = flight[1]
+            else:
+                leader = True
+                future = Future()
+                self._in_flight[key] = (max_results, future)
+
+        if not leader:
+            return future.result()[:max_results]
+
+        try:
+            results = self._disk_get(key, max_results, now)
+            if results is None:
+                with self._lock:
+                    self.misses += 1
+                results = self.backend(query, max_results, language)
+                self._disk_put(key, max_results, results, now)
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+            self._remember(key, max_results, results, now)
+            future.set_result(results)
+            return results[:max_results]
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key, (0, None))[1] is future:
+                    del self._in_flight[key]
+
+    @staticmethod
+    def _covers(asked_for: int, results: List[Dict[str, str]], max_results: int) -> bool:
+        # Fewer results than asked for means the search ran dry: asking for more won't help
+        return asked_for >= max_results or len(results) < asked_for
+
+    def _remember(self, key: Tuple[str, str], max_results: int, results: List[Dict[str, str]], now: float):
+        with self._lock:
+            self._memory[key] = (now, max_results, results)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, key: Tuple[str, str], max_results: int, now: float) -> Optional[List[Dict[str, str]]]:
+        if not self.path:
+            return None
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT max_results, results FROM searches WHERE query = ? AND language = ? AND created_at > ?",
+                (*key, now - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        results = json.loads(row[1])
+        return results if self._covers(row[0], results, max_results) else None
+
+    def _disk_put(self, key: Tuple[str, str], max_results: int, results: List[Dict[str, str]], now: float):
+        if not self.path:
+            return
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?)",
+                (*key, max_results, json.dumps(results), now),
+            )
+            db.execute("DELETE FROM searches WHERE created_at <= ?", (now - self.ttl,))
+            db.execute(
+                "DELETE FROM searches WHERE rowid NOT IN "
+                "(SELECT rowid FROM searches ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            with self._connect() as db:
+                db.execute("DELETE FROM searches")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.coalesced + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hit_ratio": (lookups - self.misses) / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+            }
+
+class CachedGoogleSearch(GoogleSearch):
+    """phi's ``GoogleSearch`` tool answered through a shared ``SearchCache``"""
+
+    def __init__(self, cache: SearchCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def google_search(self, query: str, max_results: int = 5, language: str = "en") -> str:
+        """
+        Use this function to search Google for a specified query.
+
+        Args:
+            query (str): The query to search for.
+            max_results (int, optional): The maximum number of results to return. Default is 5.
+            language (str, optional): The language of the search results. Default is "en".
+
+        Returns:
+            str: A JSON formatted string containing the search results.
+        """
+        max_results = self.fixed_max_results or max_results
+        language = self.fixed_language or language
+        return json.dumps(self.cache.search(query, max_results, language), indent=2)
@@ -0,0 +1,180 @@
+"""Chunked, parallel text-to-speech for AI Audio Tour Agent"""
+import asyncio
+import io
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+from audio_cache import AudioCache
+from config import config
+
+# The opening chunk is kept short so it is ready to play almost at once
+FIRST_CHUNK_CHARS = 250
+
+# Shared by every session, so identical audio is reused rather than synthesized again
+audio_cache = AudioCache(config.audio_cache_dir, config.audio_cache_max_bytes)
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# A sentence ends at . ! ? or … (optionally followed by a closing quote or bracket)
+SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+|(?<=[.!?…][\"'”’)\]])\s+")
+
+# MPEG audio Layer III frame header tables, indexed by MPEG version bits
+MP3_BITRATES = {
+    3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],  # MPEG-2
+    0: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],  # MPEG-2.5
+}
+MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+def split_script(text: str, max_chars: int, first_chars: int = FIRST_CHUNK_CHARS) -> List[str]:
+    """
+    Split a tour script into chunks for synthesis
+
+    Chunks break between sentences and are packed up to ``max_chars``
+    (``first_chars`` for the first one); a paragraph break always ends a
+    sentence. A single sentence longer than the limit becomes its own chunk.
+    """
+    sentences = [
+        sentence.strip()
+        for paragraph in PARAGRAPH_BREAK.split(text)
+        for sentence in SENTENCE_BREAK.split(paragraph.strip())
+        if sentence.strip()
+    ]
+    chunks: List[str] = []
+    current = ""
+    for sentence in sentences:
+        limit = first_chars if not chunks else max_chars
+        if current and len(current) + 1 + len(sentence) > limit:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _frame_length(header: bytes) -> int:
+    """Length of the Layer III frame starting with ``header``, or 0 if it isn't one"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return 0
+    version = (header[1] >> 3) & 3
+    layer = (header[1] >> 1) & 3
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+    padding = (header[2] >> 1) & 1
+    bitrate = MP3_BITRATES[version][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+def _is_info_frame(frame: bytes) -> bool:
+    """True for a Xing/Info/VBRI header frame, which describes its own file and holds no audio"""
+    version = (frame[1] >> 3) & 3
+    mono = frame[3] >> 6 == 3
+    if version == 3:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    return frame[4 + side_info:8 + side_info] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+def mp3_audio_frames(data: bytes) -> bytes:
+    """
+    Strip everything but audio frames from an MP3
+
+    Removes a leading ID3v2 tag, a trailing ID3v1 tag and a Xing/Info/VBRI
+    header frame. What is left can be concatenated with other MP3s of the
+    same format and plays as one stream, without re-encoding.
+    """
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    end = len(data)
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    # Skip anything before the first frame that is followed by another one
+    for offset in range(start, end):
+        length = _frame_length(data[offset:offset + 4])
+        if length and (offset + length >= end or _frame_length(data[offset + length:offset + length + 4])):
+            start = offset
+            break
+    else:
+        return data[start:end]  # no frames found; leave the audio alone
+    if length and _is_info_frame(data[start:start + length]):
+        start += length
+    return data[start:end]
+
+def start_event_loop() -> asyncio.AbstractEventLoop:
+    """Start an event loop that runs forever on a daemon thread"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="tts-event-loop", daemon=True).start()
+    return loop
+
+def edge_synthesizer(
+    voice_id: str,
+    speech_rate: float,
+    loop: Optional[asyncio.AbstractEventLoop] = None
+) -> Callable[[str], bytes]:
+    """
+    Synthesize with Microsoft Edge neural voices (``edge-tts``)
+
+    With ``loop`` (see ``start_event_loop``), every chunk runs on that one
+    long-lived loop; otherwise each call runs its own short-lived loop.
+    """
+    import edge_tts
+
+    # Calculate rate for edge-tts
+    rate_percent = int((speech_rate - 1.0) * 100)
+    rate_str = f"{rate_percent:+d}%"
+
+    async def collect(text: str) -> bytes:
+        audio = bytearray()
+        async for message in edge_tts.Communicate(text, voice_id, rate=rate_str).stream():
+            if message["type"] == "audio":
+                audio += message["data"]
+        return bytes(audio)
+
+    def synthesize(text: str) -> bytes:
+        if loop is None:
+            return asyncio.run(collect(text))
+        return asyncio.run_coroutine_threadsafe(collect(text), loop).result()
+
+    return synthesize
+
+def gtts_synthesizer(speech_rate: float) -> Callable[[str], bytes]:
+    """Synthesize with Google Translate's voice (``gTTS``)"""
+    from gtts import gTTS
+
+    slow_speech = speech_rate < 0.9
+
+    def synthesize(text: str) -> bytes:
+        buffer = io.BytesIO()
+        gTTS(text=text, lang='en', slow=slow_speech).write_to_fp(buffer)
+        return buffer.getvalue()
+
+    return synthesize
+
+def iter_speech(chunks: List[str], synthesize: Callable[[str], bytes], workers: int) -> Iterator[bytes]:
+    """
+    Synthesize chunks on up to ``workers`` threads, yielding their audio in order
+
+    Each chunk's audio is yielded as soon as it and every chunk before it are
+    done, as bare MP3 frames (see ``mp3_audio_frames``), so
+    ``b"".join(iter_speech(...))`` is one playable MP3. If a chunk fails, the
+    error is raised and the chunks not yet started are cancelled.
+    """
+    if not chunks:
+        return
+    executor = ThreadPoolExecutor(max_workers=max(min(workers, len(chunks)), 1), thread_name_prefix="tts")
+    try:
+        futures = [executor.submit(synthesize, chunk) for chunk in chunks]
+        for future in futures:
+            yield mp3_audio_frames(future.result())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,363 @@
+"""Benchmarks for the fallback synthesizer and the HTTP request path
+
+Usage (from this directory):
+
+    python benchmark.py                     # micro-benchmarks and load test
+    python benchmark.py micro               # synthesizer only
+    python benchmark.py load --requests 200 --concurrency 16 --endpoint jobs
+    python benchmark.py --compare benchmark_results/<old commit>.json
+
+Results are written as JSON to ``benchmark_results/<git commit>.json`` (or
+``--output``) so two commits can be compared with ``--compare``. The load
+test drives the FastAPI app in-process through ``httpx`` with Gemini replaced
+by a local stub, so it needs no API key or network and only measures this
+code. Peak RSS is the process-wide high-water mark at the end of each
+benchmark, so it only ever grows within one run.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from synth import NoteCache, generate_sine_wave, render_composition, render_melody
+
+SAMPLE_RATE = 44100
+MELODY_SIZES = (10, 100, 10_000)
+# Two octaves of A minor, so longer melodies repeat pitches like Gemini's do
+SCALE = [220.0 * 2 ** (step / 12) for step in (0, 2, 3, 5, 7, 8, 10, 12, 14, 15, 17, 19, 20, 22, 24)]
+DURATIONS = (0.05, 0.1, 0.15)
+REGRESSION_THRESHOLD = 0.10
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes everywhere else
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def summarize(timings, work=None, unit=None):
+    """Latency percentiles for ``timings`` (seconds), plus throughput of ``work`` units."""
+    total = sum(timings)
+    result = {
+        "iterations": len(timings),
+        "mean_s": total / len(timings),
+        "p50_s": percentile(timings, 50),
+        "p99_s": percentile(timings, 99),
+    }
+    if work is not None:
+        result[f"{unit}_per_s"] = work * len(timings) / total if total else 0.0
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def time_calls(func, iterations, warmup=1):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def make_melody(num_notes, seed=0):
+    rng = random.Random(seed)
+    return [{"freq": rng.choice(SCALE), "duration": rng.choice(DURATIONS)} for _ in range(num_notes)]
+
+
+def make_composition(num_notes, seed=0):
+    """A bass/pad/lead arrangement with ``num_notes`` notes spread over the voices."""
+    rng = random.Random(seed)
+    per_voice = max(num_notes // 3, 1)
+    return {
+        "voices": [
+            {"name": "bass", "notes": [
+                {"freq": rng.choice(SCALE) / 4, "duration": rng.choice(DURATIONS)} for _ in range(per_voice)
+            ]},
+            {"name": "pad", "notes": [
+                {"freq": [root, root * 2 ** (3 / 12), root * 2 ** (7 / 12)], "duration": rng.choice(DURATIONS)}
+                for root in (rng.choice(SCALE) for _ in range(per_voice))
+            ]},
+            {"name": "lead", "notes": make_melody(num_notes - 2 * per_voice, seed + 1)},
+        ]
+    }
+
+
+def iterations_for(num_notes):
+    return max(3, min(50, 2000 // num_notes))
+
+
+def run_micro():
+    """Note, melody and composition rendering at several sizes."""
+    results = {}
+
+    timings = time_calls(lambda: generate_sine_wave(440.0, 0.5, SAMPLE_RATE), 200)
+    results["note_render"] = summarize(timings, 1, "notes")
+
+    cache = NoteCache(max_bytes=64 * 1024 * 1024)
+    timings = time_calls(lambda: cache.get(440.0, 0.5, SAMPLE_RATE), 2000)
+    results["note_cache_hit"] = summarize(timings, 1, "notes")
+
+    for num_notes in MELODY_SIZES:
+        melody = make_melody(num_notes)
+        audio_seconds = sum(note["duration"] for note in melody)
+        iterations = iterations_for(num_notes)
+
+        timings = time_calls(lambda: render_melody(melody, SAMPLE_RATE), iterations)
+        results[f"melody_{num_notes}"] = summarize(timings, num_notes, "notes")
+        results[f"melody_{num_notes}"]["audio_seconds"] = audio_seconds
+
+        cache = NoteCache(max_bytes=64 * 1024 * 1024)
+        timings = time_calls(lambda: render_melody(melody, SAMPLE_RATE, cache), iterations)
+        results[f"melody_{num_notes}_cached"] = summarize(timings, num_notes, "notes")
+
+        composition = make_composition(num_notes)
+        timings = time_calls(lambda: render_composition(composition, SAMPLE_RATE), iterations)
+        results[f"composition_{num_notes}"] = summarize(timings, num_notes, "notes")
+
+    for name, result in results.items():
+        print(f"  {name:<24} p50 {result['p50_s'] * 1000:9.3f} ms  p99 {result['p99_s'] * 1000:9.3f} ms")
+    return results
+
+
+class StubGeminiModel:
+    """Stands in for ``genai.GenerativeModel``: canned answers after a fixed delay."""
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, prompt, stream=False):
+        response = self._respond(prompt)
+        if not stream:
+            time.sleep(self.latency)
+            return response
+        # Spread the delay over a handful of chunks, like a streamed reply
+        pieces = [response.text[i:i + 64] for i in range(0, len(response.text), 64)]
+        return self._stream(pieces)
+
+    def _stream(self, pieces):
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            yield self.Response(piece)
+
+    def _respond(self, prompt):
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        if '{"voices"' in prompt:
+            composition = make_composition(48, seed)
+            for voice in composition["voices"]:
+                for note in voice["notes"]:
+                    note["duration"] = 0.25
+            return self.Response(json.dumps(composition))
+        if "JSON array" in prompt:
+            melody = make_melody(24, seed)
+            for note in melody:
+                note["duration"] = 0.25
+            return self.Response(json.dumps(melody))
+        return self.Response("Calm, Piano, Slow, Minor, Ambient")
+
+
+async def drive(client, endpoint, payload):
+    """Issue one request against ``endpoint`` and wait until its audio is ready."""
+    if endpoint == "generate":
+        response = await client.post("/generate", json=payload)
+        response.raise_for_status()
+    elif endpoint == "stream":
+        params = {"prompt": payload["prompt"], "polyphonic": str(payload["polyphonic"]).lower()}
+        async with client.stream("GET", "/generate/stream", params=params) as response:
+            response.raise_for_status()
+            async for _ in response.aiter_bytes():
+                pass
+    else:
+        response = await client.post("/jobs", json=payload)
+        response.raise_for_status()
+        status_url = response.json()["status_url"]
+        while True:
+            job = (await client.get(status_url)).json()
+            if job["status"] == "done":
+                return
+            if job["status"] == "failed":
+                raise RuntimeError(job["error"])
+            await asyncio.sleep(0.01)
+
+
+async def run_load_async(app_module, args):
+    import httpx
+
+    prompts = [f"benchmark prompt {i}" for i in range(args.distinct_prompts or args.requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        payload = {"prompt": prompts[i % len(prompts)], "format": args.format, "polyphonic": args.polyphonic}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await drive(client, args.endpoint, payload)
+            except Exception as e:
+                errors += 1
+                print(f"  request {i} failed: {e}")
+                return
+            latencies.append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stats = (await client.get("/stats")).json()
+
+    return {
+        "endpoint": args.endpoint,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "distinct_prompts": len(prompts),
+        "format": args.format,
+        "polyphonic": args.polyphonic,
+        "gemini_latency_s": args.gemini_latency,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_s": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p99_s": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_mb(),
+        "result_cache_hits": stats["result_cache"]["hits"],
+    }
+
+
+def run_load(args):
+    """End-to-end requests through the FastAPI app with Gemini stubbed out."""
+    os.environ["USE_MUSICGEN"] = "false"
+    import main as app_module
+    from result_cache import ResultCache
+
+    app_module.GOOGLE_API_KEY = "benchmark"
+    stub = StubGeminiModel(args.gemini_latency)
+    app_module.get_gemini_model = lambda model_name: stub
+
+    # Keep benchmark clips out of static/generated
+    with tempfile.TemporaryDirectory(prefix="music-benchmark-") as directory:
+        app_module.result_cache = ResultCache(
+            directory=directory,
+            index_path=os.path.join(directory, "index.json"),
+            max_bytes=app_module.result_cache.max_bytes,
+            max_files=app_module.result_cache.max_files,
+        )
+        try:
+            result = asyncio.run(run_load_async(app_module, args))
+        finally:
+            app_module.musicgen_batcher.shutdown()
+            app_module.generation_pool.shutdown()
+            app_module.worker_pool.shutdown()
+
+    print(
+        f"  {result['endpoint']}: {result['throughput_rps']:.1f} req/s, "
+        f"p50 {result['p50_s'] * 1000:.1f} ms, p99 {result['p99_s'] * 1000:.1f} ms, "
+        f"{result['errors']} errors, peak RSS {result['peak_rss_mb']:.0f} MB"
+    )
+    return {f"load_{args.endpoint}": result}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print how each timing moved against a previous results file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('commit')}):")
+    regressions = 0
+    for name, result in results["benchmarks"].items():
+        old = baseline["benchmarks"].get(name)
+        if old is None:
+            continue
+        for metric in ("p50_s", "p99_s"):
+            if not old.get(metric):
+                continue
+            change = result[metric] / old[metric] - 1
+            flag = ""
+            if change > REGRESSION_THRESHOLD:
+                flag = "  <-- slower"
+                regressions += 1
+            print(f"  {name:<24} {metric:<6} {old[metric] * 1000:9.3f} -> {result[metric] * 1000:9.3f} ms ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("suite", nargs="?", choices=["all", "micro", "load"], default="all")
+    parser.add_argument("--output", help="where to write results (default: benchmark_results/<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file from an earlier run to compare with")
+    parser.add_argument("--endpoint", choices=["generate", "stream", "jobs"], default="generate")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--distinct-prompts", type=int, default=0,
+                        help="cycle through this many prompts (default: one per request, so nothing is cached)")
+    parser.add_argument("--format", choices=["wav", "wav16", "flac", "opus"], default="wav")
+    parser.add_argument("--polyphonic", action="store_true")
+    parser.add_argument("--gemini-latency", type=float, default=0.05,
+                        help="seconds the Gemini stub sleeps per call")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "benchmarks": {},
+    }
+
+    if args.suite in ("all", "micro"):
+        print("Synthesizer micro-benchmarks:")
+        results["benchmarks"].update(run_micro())
+    if args.suite in ("all", "load"):
+        print(f"Load test ({args.requests} requests, concurrency {args.concurrency}):")
+        results["benchmarks"].update(run_load(args))
+
+    output = args.output or os.path.join("benchmark_results", f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
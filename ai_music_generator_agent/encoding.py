@@ -0,0 +1,72 @@
+"""Output encodings for generated clips: float/16-bit WAV, FLAC and Ogg/Opus"""
+import numpy as np
+
+# format -> (file suffix, MIME type)
+FORMATS = {
+    "wav": (".wav", "audio/wav"),
+    "wav16": (".wav", "audio/wav"),
+    "flac": (".flac", "audio/flac"),
+    "opus": (".ogg", "audio/ogg"),
+}
+
+# Opus only runs at a handful of rates; 48 kHz is the native one
+OPUS_SAMPLE_RATE = 48000
+
+
+def float_to_pcm16(audio, rng=None):
+    """Convert float audio in [-1, 1] to int16 with TPDF dither.
+
+    Triangular dither of +/-1 LSB turns truncation distortion into a low,
+    constant noise floor. The default generator is seeded so the same clip
+    always encodes to the same bytes, which keeps the content-addressed cache
+    stable; pass one ``rng`` across calls when converting a stream in chunks.
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+    scaled = np.clip(audio, -1.0, 1.0).astype(np.float64) * 32767.0
+    scaled += rng.random(len(scaled)) - rng.random(len(scaled))
+    return np.clip(np.round(scaled), -32768, 32767).astype(np.int16)
+
+
+def resample(audio, sample_rate, target_rate):
+    if sample_rate == target_rate:
+        return audio
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    factor = gcd(sample_rate, target_rate)
+    return resample_poly(audio, target_rate // factor, sample_rate // factor).astype(np.float32)
+
+
+def encode_audio(path, audio, sample_rate, fmt="wav"):
+    """Write ``audio`` (mono float) to ``path`` in the requested format.
+
+    Everything is encoded in-process: WAV through scipy, FLAC and Opus
+    through libsndfile (the ``soundfile`` package).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    if fmt == "wav":
+        import scipy.io.wavfile
+
+        # Ensure data is float32 and normalized
+        scipy.io.wavfile.write(path, rate=sample_rate, data=audio.astype(np.float32))
+    elif fmt == "wav16":
+        import scipy.io.wavfile
+
+        scipy.io.wavfile.write(path, rate=sample_rate, data=float_to_pcm16(audio))
+    elif fmt == "flac":
+        import soundfile
+
+        soundfile.write(path, float_to_pcm16(audio), sample_rate, format="FLAC", subtype="PCM_16")
+    else:
+        import soundfile
+
+        soundfile.write(
+            path,
+            resample(audio.astype(np.float32), sample_rate, OPUS_SAMPLE_RATE),
+            OPUS_SAMPLE_RATE,
+            format="OGG",
+            subtype="OPUS",
+        )
@@ -0,0 +1,188 @@
+"""Background generation jobs: status tracking, SSE updates and the worker process pool"""
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+TERMINAL_STATES = ("done", "failed")
+
+
+class Job:
+    """One generation request tracked from queueing to a finished clip."""
+
+    def __init__(self, prompt):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.status = "queued"
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.task = None
+        self._subscribers = []
+
+    def snapshot(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def update(self, stage, progress):
+        self.status = "running"
+        self.stage = stage
+        self.progress = progress
+        self._publish()
+
+    def finish(self, result):
+        self.status = self.stage = "done"
+        self.progress = 1.0
+        self.result = result
+        self._publish()
+
+    def fail(self, error):
+        self.status = self.stage = "failed"
+        self.error = error
+        self._publish()
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATES
+
+    def _publish(self):
+        self.updated_at = time.time()
+        snapshot = self.snapshot()
+        for queue in self._subscribers:
+            queue.put_nowait(snapshot)
+
+    async def events(self, keepalive=15.0):
+        """Yield Server-Sent Events for this job until it finishes."""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            snapshot = self.snapshot()
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            while snapshot["status"] not in TERMINAL_STATES:
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    # Comment line so proxies don't close an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(snapshot)}\n\n"
+        finally:
+            self._subscribers.remove(queue)
+
+
+class JobManager:
+    """In-memory job registry; finished jobs are forgotten after ``ttl`` seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._jobs = {}
+
+    def submit(self, prompt, run):
+        """Create a job and start ``run(job)`` as a background task."""
+        self._prune()
+        job = Job(prompt)
+        self._jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job, run):
+        try:
+            await run(job)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.fail(str(e))
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return counts
+
+
+class WorkerProcessPool:
+    """``ProcessPoolExecutor`` for CPU-bound synthesis and inference.
+
+    Workers are spawned rather than forked (the web process has threads) and
+    only on first use, so importing the app never starts processes.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    async def run(self, func, *args):
+        executor = self._get_executor()
+        with self._lock:
+            self.submitted += 1
+        try:
+            future = executor.submit(func, *args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        with self._lock:
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            in_flight = self.submitted - self.completed - self.failed
+            return {
+                "max_workers": self.max_workers,
+                "started": self._executor is not None,
+                "in_flight": in_flight,
+                "queue_depth": max(in_flight - self.max_workers, 0),
+                "completed": self.completed,
+                "failed": self.failed,
+            }
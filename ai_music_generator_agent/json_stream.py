@@ -0,0 +1,72 @@
+"""Incremental parser for a JSON array of objects arriving in pieces"""
+import json
+
+
+class JSONArrayStream:
+    """Pull complete objects out of a JSON array as its text streams in.
+
+    ``feed`` takes the next piece of text and returns every object that
+    closed within it, so the first element is usable long before the array
+    ends. Anything before the opening ``[`` (such as a Markdown fence) is
+    ignored, objects that don't parse (or that ``validate`` rejects by
+    raising ValueError) are counted in ``skipped`` and dropped, and an object
+    left open when the text stops is simply never returned.
+    """
+
+    def __init__(self, validate=None):
+        self.validate = validate
+        self.skipped = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current = []
+
+    def feed(self, text):
+        items = []
+        for char in text:
+            if self._finished:
+                break
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._depth >= 2:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    self._current = [char]
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._emit(items)
+                elif self._depth == 0:
+                    self._finished = True
+        return items
+
+    def _emit(self, items):
+        try:
+            item = json.loads("".join(self._current))
+            if not isinstance(item, dict):
+                raise ValueError("not a JSON object")
+            if self.validate is not None:
+                self.validate(item)
+        except ValueError:
+            self.skipped += 1
+        else:
+            items.append(item)
+        self._current = []
@@ -0,0 +1,51 @@
+"""Long-form generation: stitch fixed-size MusicGen windows into one track"""
+import numpy as np
+
+
+def crossfade(outgoing, incoming):
+    """Linear blend from ``outgoing`` into ``incoming`` (same length).
+
+    Both sides are renditions of the same audio, so an equal-gain fade keeps
+    the level steady where an equal-power one would bulge by up to 3 dB.
+    """
+    fade_in = np.linspace(0.0, 1.0, len(outgoing), dtype=np.float32)
+    return outgoing * (1 - fade_in) + incoming * fade_in
+
+
+def iter_long_form(generate, total_samples, context_samples, crossfade_samples):
+    """Yield a track of ``total_samples`` as float32 segments, one window at a time.
+
+    ``generate(context)`` produces the next window: it is given the last
+    ``context_samples`` of the track so far (None for the first window) and
+    returns that prompt audio followed by its continuation, as MusicGen does
+    when prompted with audio. The last ``crossfade_samples`` of each window
+    are held back and blended into the next window's rendition of them, so
+    codec differences at the seam don't click. Only the context and one
+    window are kept in memory, however long the track.
+    """
+    crossfade_samples = min(crossfade_samples, context_samples)
+    tail = np.zeros(0, dtype=np.float32)  # end of the track, prompt for the next window
+    held = np.zeros(0, dtype=np.float32)  # end of the track not yet yielded
+    sent = 0
+
+    while sent + len(held) < total_samples:
+        audio = np.asarray(generate(tail if len(tail) else None), dtype=np.float32).reshape(-1)
+        continuation = audio[len(tail):]
+        if len(continuation) == 0:
+            raise RuntimeError("Generator returned no new audio")
+
+        if len(held):
+            redo = audio[len(tail) - len(held):len(tail)]
+            segment = np.concatenate([crossfade(held, redo), continuation])
+        else:
+            segment = continuation
+        segment = segment[:total_samples - sent]
+        tail = np.concatenate([tail[:len(tail) - len(held)], segment])[-context_samples:]
+
+        last = sent + len(segment) >= total_samples
+        keep = 0 if last else min(crossfade_samples, len(segment))
+        held = segment[len(segment) - keep:]
+        out = segment[:len(segment) - keep]
+        sent += len(out)
+        if len(out):
+            yield out
@@ -1,15 +1,27 @@
 import os
-import uuid
+import asyncio
 import numpy as np
-import scipy.io.wavfile
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Literal
 from dotenv import load_dotenv
-import google.generativeai as genai
 import math
 import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from result_cache import ResultCache, normalize_prompt
+from encoding import FORMATS, encode_audio, float_to_pcm16
+from synth import NoteCache, iter_melody, parse_chord, parse_note, render_composition
+from jobs import JobManager, WorkerProcessPool
+import worker
+from worker import musicgen_continue, musicgen_generate
+from longform import iter_long_form
+from json_stream import JSONArrayStream
+from static_files import CachingStaticFiles, precompress
 
 # Load environment variables
 from pathlib import Path
@@ -23,6 +35,16 @@ app = FastAPI()
 GENERATED_DIR = "static/generated"
 os.makedirs(GENERATED_DIR, exist_ok=True)
 
+# Generated clips are content-addressed, so identical requests reuse a file
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "512"))
+RESULT_CACHE_MAX_FILES = int(os.getenv("RESULT_CACHE_MAX_FILES", "500"))
+result_cache = ResultCache(
+    directory=GENERATED_DIR,
+    index_path=os.getenv("RESULT_CACHE_INDEX", "generated_index.json"),
+    max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+    max_files=RESULT_CACHE_MAX_FILES,
+)
+
 # Configure Gemini
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
@@ -31,177 +53,715 @@ if not GOOGLE_API_KEY:
 else:
     GOOGLE_API_KEY = GOOGLE_API_KEY.strip()
     print(f"API Key found: {GOOGLE_API_KEY[:5]}...")
-    genai.configure(api_key=GOOGLE_API_KEY)
 
-# Try to load MusicGen
+_genai = None
+
+def get_gemini_model(model_name):
+    """Return a Gemini model, importing and configuring the SDK on first use.
+
+    google.generativeai takes a good fraction of a second to import, so it is
+    kept off the startup path.
+    """
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GOOGLE_API_KEY)
+        _genai = genai
+    return _genai.GenerativeModel(model_name)
+
+# MusicGen is opt-in. torch/transformers are only imported by the background
+# warm-up, so the server starts immediately and serves requests with the
+# fallback synthesizer until the model is ready.
+USE_MUSICGEN = os.getenv("USE_MUSICGEN", "false").lower() in ("1", "true", "yes")
+MUSICGEN_MODEL = os.getenv("MUSICGEN_MODEL", "facebook/musicgen-small")
+
 processor = None
 model_music = None
-USE_FALLBACK = False
-
-try:
-    from transformers import AutoProcessor, MusicgenForConditionalGeneration
-    import torch
-    print("Loading MusicGen model... This might take a while.")
-    # processor = AutoProcessor.from_pretrained("facebook/musicgen-small")
-    # model_music = MusicgenForConditionalGeneration.from_pretrained("facebook/musicgen-small")
-    # print("MusicGen model loaded successfully!")
-    # Commented out to prevent auto-download on start if user hasn't installed torch yet.
-    # We will load it on demand or if explicitly installed.
-    # For this demo, we will default to fallback if torch fails to import or load.
-    USE_FALLBACK = True # Set to False if you have torch installed and want to use MusicGen
-except ImportError:
-    print("Transformers/Torch not found. Using fallback synthesizer.")
-    USE_FALLBACK = True
+USE_FALLBACK = not USE_MUSICGEN
+model_state = "loading" if USE_MUSICGEN else "disabled"
+model_error = None
+_warmup_task = None
+
+def load_musicgen():
+    global processor, model_music, USE_FALLBACK, model_state, model_error
+    try:
+        from transformers import AutoProcessor, MusicgenForConditionalGeneration
+        print("Loading MusicGen model... This might take a while.")
+        loaded_processor = AutoProcessor.from_pretrained(MUSICGEN_MODEL)
+        loaded_model = MusicgenForConditionalGeneration.from_pretrained(MUSICGEN_MODEL)
+        processor, model_music = loaded_processor, loaded_model
+        model_state = "ready"
+        print("MusicGen loaded.")
+    except Exception as e:
+        print(f"Could not load MusicGen: {e}. Switching to fallback.")
+        USE_FALLBACK = True
+        model_state = "failed"
+        model_error = str(e)
 
 @app.on_event("startup")
 async def startup_event():
-    global processor, model_music, USE_FALLBACK
-    if not USE_FALLBACK:
-        try:
-            processor = AutoProcessor.from_pretrained("facebook/musicgen-small")
-            model_music = MusicgenForConditionalGeneration.from_pretrained("facebook/musicgen-small")
-            print("MusicGen loaded.")
-        except Exception as e:
-            print(f"Could not load MusicGen: {e}. Switching to fallback.")
-            USE_FALLBACK = True
+    global _warmup_task
+    written = await asyncio.to_thread(precompress, "static", exclude=(GENERATED_DIR,))
+    if written:
+        print(f"Precompressed {written} static asset variant(s).")
+    if USE_MUSICGEN:
+        # Not awaited: the app starts serving while the model loads
+        _warmup_task = asyncio.create_task(asyncio.to_thread(load_musicgen))
+    else:
+        print("MusicGen disabled. Using fallback synthesizer.")
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+static_files = CachingStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
 
 @app.get("/")
-async def read_root():
-    return FileResponse("static/index.html")
+async def read_root(request: Request):
+    return await static_files.get_response("index.html", request.scope)
 
 class MusicRequest(BaseModel):
     prompt: str
+    format: Literal["wav", "wav16", "flac", "opus"] = "wav"
+    # Ask for a multi-voice arrangement (bass, pad, lead) instead of a melody
+    polyphonic: bool = False
 
 import json
 import re
 
-def generate_sine_wave(frequency, duration, sample_rate=44100):
-    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
-    # Add some harmonics for a richer sound
-    wave = 0.5 * np.sin(2 * np.pi * frequency * t)
-    wave += 0.2 * np.sin(4 * np.pi * frequency * t) # 2nd harmonic
-    wave += 0.1 * np.sin(6 * np.pi * frequency * t) # 3rd harmonic
-    
-    # Simple ADSR Envelope
-    total_samples = len(t)
-    attack = int(0.1 * total_samples)
-    decay = int(0.1 * total_samples)
-    release = int(0.2 * total_samples)
-    sustain = total_samples - attack - decay - release
-    
-    envelope = np.concatenate([
-        np.linspace(0, 1, attack),
-        np.linspace(1, 0.7, decay),
-        np.full(sustain, 0.7),
-        np.linspace(0.7, 0, release)
-    ])
-    
-    if len(envelope) != len(wave):
-        # Handle rounding errors
-        envelope = np.resize(envelope, len(wave))
-        
-    return wave * envelope
+NOTE_CACHE_MB = float(os.getenv("NOTE_CACHE_MB", "64"))
+note_cache = NoteCache(max_bytes=int(NOTE_CACHE_MB * 1024 * 1024))
 
-def generate_fallback_music(prompt):
-    sample_rate = 44100
-    
-    # Default melody if Gemini fails
-    melody = [{"freq": 440, "duration": 0.5}, {"freq": 523.25, "duration": 0.5}]
+# Default melody if Gemini isn't configured
+DEFAULT_MELODY = [{"freq": 440, "duration": 0.5}, {"freq": 523.25, "duration": 0.5}]
+
+def melody_prompt(prompt):
+    return f"""
+    You are a music composer. Create a simple monophonic melody for a '{prompt}' mood.
+    Return ONLY a JSON array of objects, where each object has:
+    - 'freq': float (frequency in Hz, e.g., 261.63 for C4, 440 for A4). Keep between 100 and 800.
+    - 'duration': float (duration in seconds, e.g., 0.25, 0.5, 1.0).
     
-    if GOOGLE_API_KEY:
+    Total duration should be around 5-8 seconds.
+    Example output: [{{"freq": 440, "duration": 0.5}}, {{"freq": 523.25, "duration": 0.5}}]
+    DO NOT include markdown formatting like ```json. Just the raw JSON string.
+    """
+
+def stream_gemini_melody(prompt):
+    """Yield Gemini's melody notes while its reply streams in, each as soon as its object closes.
+
+    Stray ``` fences are ignored, and malformed or unterminated objects and
+    notes ``parse_note`` rejects are skipped, so a sloppy or truncated reply still gives the notes before it.
+    """
+    gemini_model = get_gemini_model('gemini-2.5-flash')
+    response = gemini_model.generate_content(melody_prompt(prompt), stream=True)
+    parser = JSONArrayStream(validate=parse_note)
+    for chunk in response:
+        yield from parser.feed(chunk.text)
+    if parser.skipped:
+        print(f"Skipped {parser.skipped} malformed or invalid note(s) from Gemini.")
+
+def valid_notes(notes, parse=parse_note):
+    """The notes ``parse`` accepts; the rest are dropped (and counted in the log)."""
+    kept = []
+    for note in notes:
         try:
-            print("Asking Gemini to compose melody...")
-            gemini_model = genai.GenerativeModel('gemini-2.5-flash')
-            gemini_prompt = f"""
-            You are a music composer. Create a simple monophonic melody for a '{prompt}' mood.
-            Return ONLY a JSON array of objects, where each object has:
-            - 'freq': float (frequency in Hz, e.g., 261.63 for C4, 440 for A4). Keep between 100 and 800.
-            - 'duration': float (duration in seconds, e.g., 0.25, 0.5, 1.0).
-            
-            Total duration should be around 5-8 seconds.
-            Example output: [{{"freq": 440, "duration": 0.5}}, {{"freq": 523.25, "duration": 0.5}}]
-            DO NOT include markdown formatting like ```json. Just the raw JSON string.
-            """
-            response = gemini_model.generate_content(gemini_prompt)
-            text_response = response.text.strip()
-            # Clean up markdown if present
-            text_response = text_response.replace("```json", "").replace("```", "")
-            melody = json.loads(text_response)
-            print(f"Gemini composed {len(melody)} notes.")
-        except Exception as e:
-            print(f"Gemini composition failed: {e}. Using random notes.")
-            # Fallback to random if Gemini fails
-            melody = []
-            base_freq = 220 if "sad" in prompt.lower() else 440
-            for _ in range(10):
-                melody.append({
-                    "freq": base_freq * (2 ** (random.randint(0, 12) / 12)),
-                    "duration": 0.5
-                })
-
-    audio = np.array([], dtype=np.float32)
-    
-    for note in melody:
-        freq = float(note.get("freq", 440))
-        duration = float(note.get("duration", 0.5))
-        # Cap duration to avoid hanging
-        duration = min(duration, 2.0)
-        
-        wave = generate_sine_wave(freq, duration, sample_rate)
-        audio = np.concatenate((audio, wave.astype(np.float32)))
-        
-    return audio, sample_rate
+            parse(note)
+        except ValueError:
+            continue
+        kept.append(note)
+    if len(kept) < len(notes):
+        print(f"Dropped {len(notes) - len(kept)} invalid note(s) from Gemini.")
+    return kept
+
+def request_melody(prompt):
+    """Ask Gemini for a melody matching ``prompt``; raises if no valid notes come back."""
+    print("Asking Gemini to compose melody...")
+    melody = []
+    try:
+        for note in stream_gemini_melody(prompt):
+            melody.append(note)
+    except Exception as e:
+        if not melody:
+            raise
+        print(f"Gemini reply cut short ({e}); keeping {len(melody)} notes.")
+    # Checked before it is returned, since whatever comes back here is cached
+    melody = valid_notes(melody)
+    if not melody:
+        raise ValueError("Gemini returned no notes")
+    print(f"Gemini composed {len(melody)} notes.")
+    return melody
+
+def random_melody(prompt):
+    melody = []
+    base_freq = 220 if "sad" in prompt.lower() else 440
+    for _ in range(10):
+        melody.append({
+            "freq": base_freq * (2 ** (random.randint(0, 12) / 12)),
+            "duration": 0.5
+        })
+    return melody
+
+# Default arrangement if Gemini isn't configured: C - Am - F - G
+DEFAULT_COMPOSITION = {
+    "voices": [
+        {"name": "bass", "notes": [{"freq": f, "duration": 2.0} for f in (65.41, 55.0, 87.31, 98.0)]},
+        {"name": "pad", "notes": [
+            {"freq": [261.63, 329.63, 392.0], "duration": 2.0},
+            {"freq": [220.0, 261.63, 329.63], "duration": 2.0},
+            {"freq": [174.61, 220.0, 261.63], "duration": 2.0},
+            {"freq": [196.0, 246.94, 293.66], "duration": 2.0},
+        ]},
+        {"name": "lead", "notes": [{"freq": f, "duration": 0.5} for f in (
+            523.25, 392.0, 440.0, 392.0, 523.25, 440.0, 349.23, 329.63,
+            349.23, 440.0, 523.25, 440.0, 392.0, 493.88, 587.33, 523.25,
+        )]},
+    ]
+}
+
+def request_composition(prompt):
+    """Ask Gemini for a multi-voice arrangement; raises if the call or parsing fails."""
+    print("Asking Gemini to compose arrangement...")
+    gemini_model = get_gemini_model('gemini-2.5-flash')
+    gemini_prompt = f"""
+    You are a music composer. Arrange a short piece for a '{prompt}' mood with three voices.
+    Return ONLY a JSON object of the form {{"voices": [voice, ...]}} where each voice has:
+    - 'name': one of "bass", "pad", "lead" (or "pluck").
+    - 'notes': array of objects with 'freq' and 'duration' (seconds, e.g. 0.25, 0.5, 1.0, 2.0).
+      'freq' is a float in Hz, a list of floats for a chord, or null for a rest.
+    Bass stays between 40 and 160 Hz, the pad plays chords between 150 and 600 Hz,
+    the lead melody stays between 200 and 1000 Hz. All voices play at the same time,
+    so each voice's durations should add up to the same total of around 8-12 seconds.
+    Example output: {{"voices": [{{"name": "bass", "notes": [{{"freq": 65.41, "duration": 2.0}}]}},
+    {{"name": "pad", "notes": [{{"freq": [261.63, 329.63, 392.0], "duration": 2.0}}]}},
+    {{"name": "lead", "notes": [{{"freq": 523.25, "duration": 0.5}}, {{"freq": null, "duration": 0.5}}]}}]}}
+    DO NOT include markdown formatting like ```json. Just the raw JSON string.
+    """
+    response = gemini_model.generate_content(gemini_prompt)
+    text_response = response.text.strip()
+    # Clean up markdown if present
+    text_response = text_response.replace("```json", "").replace("```", "")
+    composition = json.loads(text_response)
+    if not isinstance(composition, dict) or not isinstance(composition.get("voices"), list):
+        raise ValueError("Gemini returned no voices")
+    # Checked before it is returned, since whatever comes back here is cached
+    voices = []
+    for voice in composition["voices"]:
+        if not isinstance(voice, dict) or not isinstance(voice.get("notes"), list):
+            continue
+        gain = voice.get("gain")
+        if gain is not None and (
+            isinstance(gain, bool) or not isinstance(gain, (int, float)) or not math.isfinite(gain)
+        ):
+            voice = {key: value for key, value in voice.items() if key != "gain"}
+        notes = valid_notes(voice["notes"], parse_chord)
+        if notes:
+            voices.append({**voice, "notes": notes})
+    if not voices:
+        raise ValueError("Gemini returned no voices")
+    composition = {**composition, "voices": voices}
+    print(f"Gemini arranged {len(composition['voices'])} voices.")
+    return composition
+
+def random_composition(prompt):
+    base_freq = 110 if "sad" in prompt.lower() else 220
+    # Minor or major triads on scale degrees I, VI, IV, V
+    third = 3 if "sad" in prompt.lower() else 4
+    roots = [base_freq * 2 ** (step / 12) for step in (0, 8 if third == 3 else 9, 5, 7)]
+    return {
+        "voices": [
+            {"name": "bass", "notes": [{"freq": root / 2, "duration": 2.0} for root in roots]},
+            {"name": "pad", "notes": [
+                {"freq": [root, root * 2 ** (third / 12), root * 2 ** (7 / 12)], "duration": 2.0}
+                for root in roots
+            ]},
+            {"name": "lead", "notes": random_melody(prompt) + random_melody(prompt)[:6]},
+        ]
+    }
+
+FALLBACK_SAMPLE_RATE = 44100
+
+def request_enhanced_prompt(user_prompt):
+    """Have Gemini describe the requested music in five words; raises on failure."""
+    gemini_model = get_gemini_model('gemini-1.5-flash')
+    gemini_prompt = f"You are a music composer. The user wants: '{user_prompt}'. Describe this music in 5 words (e.g. 'Sad, Piano, Slow, Minor, Ambient')."
+    response = gemini_model.generate_content(gemini_prompt)
+    enhanced_prompt = response.text.strip()
+    if not enhanced_prompt:
+        raise ValueError("Gemini returned an empty description")
+    print(f"Enhanced prompt: {enhanced_prompt}")
+    return enhanced_prompt
+
+MUSICGEN_MAX_NEW_TOKENS = 256
+
+def generate_musicgen_batch(prompts):
+    """Run one padded MusicGen ``generate`` call for several prompts."""
+    return musicgen_generate(processor, model_music, prompts, MUSICGEN_MAX_NEW_TOKENS)
+
+# Long-form mode: tracks longer than one generate call are produced in
+# windows of MUSICGEN_WINDOW_TOKENS, each prompted with the last
+# MUSICGEN_CONTEXT_SECONDS of the track so far
+MUSICGEN_WINDOW_TOKENS = int(os.getenv("MUSICGEN_WINDOW_TOKENS", "256"))
+MUSICGEN_CONTEXT_SECONDS = float(os.getenv("MUSICGEN_CONTEXT_SECONDS", "2.0"))
+MUSICGEN_CROSSFADE_SECONDS = float(os.getenv("MUSICGEN_CROSSFADE_SECONDS", "0.25"))
+MUSICGEN_MAX_SECONDS = float(os.getenv("MUSICGEN_MAX_SECONDS", "600"))
+
+def iter_musicgen_long_form(prompt, duration):
+    """Yield ``duration`` seconds of MusicGen audio for ``prompt``, one window at a time."""
+    audio_config = model_music.config.audio_encoder
+    sampling_rate = audio_config.sampling_rate
+    # Keep the context on EnCodec frame boundaries so the window's rendition
+    # of it lines up sample for sample with the track
+    hop = sampling_rate // audio_config.frame_rate
+    context_samples = max(int(MUSICGEN_CONTEXT_SECONDS * sampling_rate) // hop, 1) * hop
+    return iter_long_form(
+        lambda context: musicgen_continue(processor, model_music, prompt, context, MUSICGEN_WINDOW_TOKENS),
+        total_samples=int(min(duration, MUSICGEN_MAX_SECONDS) * sampling_rate),
+        context_samples=context_samples,
+        crossfade_samples=int(MUSICGEN_CROSSFADE_SECONDS * sampling_rate),
+    )
+
+def use_musicgen():
+    return not USE_FALLBACK and processor is not None and model_music is not None
+
+# Streaming WAV: the RIFF and data sizes are unknown while we're still
+# synthesizing, so they're set to 0xFFFFFFFF, which players treat as
+# "read until the connection closes".
+WAV_STREAM_SIZE = 0xFFFFFFFF
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+STREAM_CHUNK_SAMPLES = 8192
+
+def wav_stream_header(sample_rate, channels=1, bits_per_sample=32, format_tag=WAVE_FORMAT_IEEE_FLOAT):
+    block_align = channels * bits_per_sample // 8
+    return (
+        b"RIFF" + struct.pack("<I", WAV_STREAM_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack(
+            "<IHHIIHH", 16, format_tag, channels, sample_rate,
+            sample_rate * block_align, block_align, bits_per_sample,
+        )
+        + b"data" + struct.pack("<I", WAV_STREAM_SIZE)
+    )
+
+class GenerationPool:
+    """Bounded thread pool for the blocking parts of a request.
+
+    Gemini's client, MusicGen inference and WAV writing are all synchronous, so
+    the async handlers hand them to this pool instead of running them on the
+    event loop. ``max_workers`` caps how many run at once; the rest wait in the
+    executor's queue, which ``stats()`` reports as ``queue_depth``.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generate")
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(self._call, func, args)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _call(self, func, args):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def _on_done(self, future):
+        # Cancelled before a worker picked it up, so _call never ran
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queue_depth": self.queued,
+                "completed": self.completed,
+            }
+
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "4"))
+generation_pool = GenerationPool(max_workers=GENERATION_WORKERS)
+
+class MusicGenBatcher:
+    """Collects concurrent MusicGen requests into a single padded ``generate`` call.
+
+    The first request opens a batch; it closes after ``max_wait`` seconds or
+    once ``max_batch_size`` prompts have joined, whichever is first. Batches
+    run one at a time on ``generation_pool``, so requests arriving while the
+    model is busy pile up into the next batch instead of competing for the CPU.
+    """
+
+    def __init__(self, max_batch_size, max_wait):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self.largest_batch = 0
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    async def generate(self, prompt):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        future = loop.create_future()
+        await self._queue.put((prompt, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Drop requests whose client already went away
+            batch = [(prompt, future) for prompt, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            print(f"MusicGen batch of {len(batch)} prompt(s).")
+            try:
+                results = await generation_pool.run(
+                    generate_musicgen_batch, [prompt for prompt, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+
+    def shutdown(self):
+        if self._worker is not None:
+            self._worker.cancel()
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+MUSICGEN_MAX_BATCH = int(os.getenv("MUSICGEN_MAX_BATCH", "4"))
+MUSICGEN_BATCH_WAIT_MS = float(os.getenv("MUSICGEN_BATCH_WAIT_MS", "50"))
+musicgen_batcher = MusicGenBatcher(
+    max_batch_size=MUSICGEN_MAX_BATCH,
+    max_wait=MUSICGEN_BATCH_WAIT_MS / 1000,
+)
+
+class CoalescingCache:
+    """TTL cache for slow async calls that also coalesces concurrent misses.
+
+    The first caller for a key runs ``compute``; callers that arrive while it
+    is in flight await the same task instead of issuing their own request.
+    Only successful results are cached, so a failed Gemini call is retried by
+    the next request rather than remembered for ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._entries = OrderedDict()  # key -> (expires_at, value, cost_seconds)
+        self._inflight = {}  # key -> (task, started_at)
+
+    async def get(self, key, compute):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, cost = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += cost
+                return value
+            del self._entries[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            task, started_at = inflight
+            self.coalesced += 1
+            # We only wait for the remainder of the call already under way
+            self.saved_seconds += now - started_at
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        # Run the call as its own task so that a leader whose client
+        # disconnects doesn't cancel it for everyone else waiting on it
+        task = asyncio.ensure_future(self._compute(key, compute, now))
+        self._inflight[key] = (task, now)
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute, started_at):
+        try:
+            value = await compute()
+        finally:
+            del self._inflight[key]
+        self.put(key, value, time.monotonic() - started_at)
+        return value
+
+    def peek(self, key):
+        """Return the cached value for ``key`` or None, without computing it."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += entry[2]
+        return entry[1]
+
+    def put(self, key, value, cost):
+        """Cache a value produced outside ``get``, e.g. assembled from a stream."""
+        self._entries[key] = (time.monotonic() + self.ttl, value, cost)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl,
+        }
+
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "3600"))
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "1024"))
+enhancement_cache = CoalescingCache(ttl=GEMINI_CACHE_TTL, max_entries=GEMINI_CACHE_MAX_ENTRIES)
+melody_cache = CoalescingCache(ttl=GEMINI_CACHE_TTL, max_entries=GEMINI_CACHE_MAX_ENTRIES)
+
+async def get_enhanced_prompt(user_prompt):
+    """Gemini's five-word description of ``user_prompt`` for MusicGen, or the prompt itself.
+
+    Goes through ``enhancement_cache`` and the generation pool; any Gemini
+    failure falls back to the user's prompt.
+    """
+    if not GOOGLE_API_KEY:
+        return user_prompt
+    try:
+        return await enhancement_cache.get(
+            normalize_prompt(user_prompt),
+            lambda: generation_pool.run(request_enhanced_prompt, user_prompt),
+        )
+    except Exception as e:
+        print(f"Gemini error: {e}")
+        return user_prompt
+
+async def get_melody(prompt, polyphonic=False):
+    """A melody (or, when ``polyphonic``, a multi-voice arrangement) for ``prompt``.
+
+    Gemini's reply goes through ``melody_cache`` and the generation pool. Without
+    a key the default tune is used, and if Gemini fails, random notes or chords.
+    """
+    if not GOOGLE_API_KEY:
+        return DEFAULT_COMPOSITION if polyphonic else DEFAULT_MELODY
+    request = request_composition if polyphonic else request_melody
+    try:
+        return await melody_cache.get(
+            (normalize_prompt(prompt), polyphonic),
+            lambda: generation_pool.run(request, prompt),
+        )
+    except Exception as e:
+        if polyphonic:
+            print(f"Gemini arrangement failed: {e}. Using random chords.")
+            return random_composition(prompt)
+        print(f"Gemini composition failed: {e}. Using random notes.")
+        return random_melody(prompt)
+
+# CPU-bound synthesis and encoding for /jobs run in separate processes so
+# they can use every core. MusicGen stays in this process, on the batcher.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 2)))
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+worker_pool = WorkerProcessPool(max_workers=JOB_WORKERS)
+job_manager = JobManager(ttl=JOB_TTL)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    musicgen_batcher.shutdown()
+    generation_pool.shutdown()
+    worker_pool.shutdown()
+    result_cache.flush()
+
+def stream_header(sample_rate, fmt):
+    if fmt == "wav16":
+        return wav_stream_header(sample_rate, bits_per_sample=16, format_tag=WAVE_FORMAT_PCM)
+    return wav_stream_header(sample_rate)
+
+def stream_chunk(audio, fmt, rng):
+    if fmt == "wav16":
+        return float_to_pcm16(audio, rng).astype("<i2", copy=False).tobytes()
+    return audio.astype("<f4", copy=False).tobytes()
+
+def iter_live_melody(prompt, live):
+    """Notes from ``stream_gemini_melody``, or random ones if Gemini gives none.
+
+    Gemini's notes are collected in ``live["notes"]``, and ``live["complete"]``
+    is set once the whole reply has arrived, so the caller knows it can cache it.
+    """
+    print("Asking Gemini to compose melody (streaming)...")
+    try:
+        for note in stream_gemini_melody(prompt):
+            live["notes"].append(note)
+            yield note
+        live["complete"] = bool(live["notes"])
+    except Exception as e:
+        print(f"Gemini composition failed: {e}.")
+    if not live["notes"]:
+        print("No notes from Gemini. Using random notes.")
+        yield from random_melody(prompt)
+
+async def stream_music(user_prompt, fmt="wav", polyphonic=False, duration=None):
+    """Yield a WAV stream: the header right away, then audio as it is rendered."""
+    # One dither generator for the whole stream rather than one per chunk
+    rng = np.random.default_rng(0)
+    try:
+        if use_musicgen() and duration:
+            print(f"Streaming {duration:g}s of long-form MusicGen output.")
+            yield stream_header(model_music.config.audio_encoder.sampling_rate, fmt)
+            enhanced_prompt = await get_enhanced_prompt(user_prompt)
+            windows = iter_musicgen_long_form(enhanced_prompt, duration)
+            # Each window is generated on the pool and sent as soon as it's done
+            while (segment := await generation_pool.run(next, windows, None)) is not None:
+                for start in range(0, len(segment), STREAM_CHUNK_SAMPLES):
+                    yield stream_chunk(segment[start:start + STREAM_CHUNK_SAMPLES], fmt, rng)
+        elif use_musicgen():
+            print("Streaming MusicGen output.")
+            yield stream_header(model_music.config.audio_encoder.sampling_rate, fmt)
+            enhanced_prompt = await get_enhanced_prompt(user_prompt)
+            audio_data, _ = await musicgen_batcher.generate(enhanced_prompt)
+            for start in range(0, len(audio_data), STREAM_CHUNK_SAMPLES):
+                yield stream_chunk(audio_data[start:start + STREAM_CHUNK_SAMPLES], fmt, rng)
+        else:
+            print("Streaming fallback generator.")
+            sample_rate = FALLBACK_SAMPLE_RATE
+            yield stream_header(sample_rate, fmt)
+            if polyphonic:
+                melody = await get_melody(user_prompt, polyphonic)
+                # Voices are mixed in one pass over the whole timeline
+                audio_data = await generation_pool.run(render_composition, melody, sample_rate)
+                for start in range(0, len(audio_data), STREAM_CHUNK_SAMPLES):
+                    yield stream_chunk(audio_data[start:start + STREAM_CHUNK_SAMPLES], fmt, rng)
+            else:
+                live = None
+                if not GOOGLE_API_KEY:
+                    melody = DEFAULT_MELODY
+                else:
+                    # Render each note as soon as Gemini's reply contains it,
+                    # unless the whole melody is already cached
+                    cache_key = (normalize_prompt(user_prompt), False)
+                    started_at = time.monotonic()
+                    melody = melody_cache.peek(cache_key)
+                    if melody is None:
+                        live = {"notes": [], "complete": False}
+                        melody = iter_live_melody(user_prompt, live)
+                notes = iter_melody(melody, sample_rate, note_cache)
+                # Cache misses are synthesized on the pool too, one note at a time
+                while (note := await generation_pool.run(next, notes, None)) is not None:
+                    yield stream_chunk(note, fmt, rng)
+                if live is not None and live["complete"]:
+                    melody_cache.put(cache_key, live["notes"], time.monotonic() - started_at)
+    except Exception as e:
+        # Headers are already sent, so all we can do is end the stream early
+        print(f"Streaming error: {e}")
+        import traceback
+        traceback.print_exc()
+
+def clip_backend():
+    """Which backend a new clip will come from, and at what sample rate."""
+    if use_musicgen():
+        return "musicgen", model_music.config.audio_encoder.sampling_rate
+    return "fallback", FALLBACK_SAMPLE_RATE
+
+def clip_cache_key(request, enhanced_prompt, backend, sampling_rate):
+    return ResultCache.make_key(
+        normalize_prompt(request.prompt), normalize_prompt(enhanced_prompt), backend, sampling_rate,
+        request.format, request.polyphonic and backend == "fallback",
+    )
+
+def clip_response(request, enhanced_prompt, filename):
+    return {
+        "message": f"Generated music for: '{enhanced_prompt}'",
+        "audio_url": f"/static/generated/{filename}",
+        "format": request.format,
+        "mime_type": FORMATS[request.format][1],
+    }
 
 @app.post("/generate")
 async def generate_music(request: MusicRequest):
-    global processor, model_music, USE_FALLBACK
-    
     user_prompt = request.prompt
-    print(f"Received prompt: {user_prompt}")
+    fmt = request.format
+    print(f"Received prompt: {user_prompt} ({fmt})")
 
     # Step 1: Enhance prompt using Gemini
-    enhanced_prompt = user_prompt
-    if GOOGLE_API_KEY:
-        try:
-            gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-            gemini_prompt = f"You are a music composer. The user wants: '{user_prompt}'. Describe this music in 5 words (e.g. 'Sad, Piano, Slow, Minor, Ambient')."
-            response = gemini_model.generate_content(gemini_prompt)
-            if response.text:
-                enhanced_prompt = response.text.strip()
-                print(f"Enhanced prompt: {enhanced_prompt}")
-        except Exception as e:
-            print(f"Gemini error: {e}")
-
-    # Step 2: Generate Music
+    enhanced_prompt = await get_enhanced_prompt(user_prompt)
+
+    # Step 2: Generate Music, unless this exact clip is already on disk
     try:
-        filename = f"{uuid.uuid4()}.wav"
-        filepath = os.path.join(GENERATED_DIR, filename)
-        
-        if not USE_FALLBACK and processor and model_music:
-            print("Using MusicGen model.")
-            inputs = processor(
-                text=[enhanced_prompt],
-                padding=True,
-                return_tensors="pt",
-            )
-            audio_values = model_music.generate(**inputs, max_new_tokens=256)
-            sampling_rate = model_music.config.audio_encoder.sampling_rate
-            audio_data = audio_values[0, 0].numpy()
-            scipy.io.wavfile.write(filepath, rate=sampling_rate, data=audio_data)
+        backend, sampling_rate = clip_backend()
+        cache_key = clip_cache_key(request, enhanced_prompt, backend, sampling_rate)
+        filename = result_cache.lookup(cache_key)
+
+        if filename:
+            print(f"Serving cached clip {filename}.")
         else:
-            # Fallback generation
-            print("Using fallback generator.")
-            audio_data, sampling_rate = generate_fallback_music(user_prompt)
-            # Ensure data is float32 and normalized
-            audio_data = audio_data.astype(np.float32)
-            scipy.io.wavfile.write(filepath, rate=sampling_rate, data=audio_data)
+            if backend == "musicgen":
+                print("Using MusicGen model.")
+                audio_data, sampling_rate = await musicgen_batcher.generate(enhanced_prompt)
+            else:
+                # Fallback generation
+                print("Using fallback generator.")
+                melody = await get_melody(user_prompt, request.polyphonic)
+                audio_data = await generation_pool.run(render_composition, melody, sampling_rate, note_cache)
+            filename = await generation_pool.run(
+                result_cache.store,
+                cache_key,
+                lambda path: encode_audio(path, audio_data, sampling_rate, fmt),
+                FORMATS[fmt][0],
+            )
         
-        return {
-            "message": f"Generated music for: '{enhanced_prompt}'",
-            "audio_url": f"/static/generated/{filename}"
-        }
+        return clip_response(request, enhanced_prompt, filename)
 
     except Exception as e:
         print(f"Generation error: {e}")
@@ -209,6 +769,126 @@ async def generate_music(request: MusicRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Server Error: {str(e)}")
 
+async def run_job(job, request):
+    """The /generate pipeline as a background job.
+
+    MusicGen runs on the shared batcher like /generate; fallback synthesis and
+    encoding go to the worker processes.
+    """
+    fmt = request.format
+    job.update("enhancing", 0.1)
+    enhanced_prompt = await get_enhanced_prompt(request.prompt)
+
+    backend, sampling_rate = clip_backend()
+    cache_key = clip_cache_key(request, enhanced_prompt, backend, sampling_rate)
+    filename = result_cache.lookup(cache_key)
+
+    if filename is None:
+        suffix = FORMATS[fmt][0]
+        tmp_path = result_cache.new_temp_path(suffix)
+        try:
+            if backend == "musicgen":
+                job.update("generating", 0.3)
+                audio_data, sampling_rate = await musicgen_batcher.generate(enhanced_prompt)
+                job.update("rendering", 0.8)
+                await worker_pool.run(encode_audio, tmp_path, audio_data, sampling_rate, fmt)
+            else:
+                job.update("composing", 0.3)
+                melody = await get_melody(request.prompt, request.polyphonic)
+                job.update("rendering", 0.6)
+                await worker_pool.run(worker.render_fallback, melody, sampling_rate, fmt, tmp_path)
+        except BaseException:
+            result_cache.discard_temp(tmp_path)
+            raise
+        filename = await generation_pool.run(result_cache.add, cache_key, tmp_path, suffix)
+
+    job.finish(clip_response(request, enhanced_prompt, filename))
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: MusicRequest):
+    """Queue a generation job and return immediately with its id."""
+    print(f"Queued job for prompt: {request.prompt} ({request.format})")
+    job = job_manager.submit(request.prompt, lambda job: run_job(job, request))
+    return {
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events with the job's status until it is done or failed."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/generate/stream")
+async def generate_music_stream(
+    prompt: str,
+    format: Literal["wav", "wav16"] = "wav",
+    polyphonic: bool = False,
+    duration: float | None = None,
+):
+    """Stream the clip as chunked audio/wav so playback can start before rendering ends.
+
+    A plain GET so the URL can be used directly as an ``<audio>`` source. Nothing
+    is written to disk; blocking steps run on ``generation_pool``. Only the WAV
+    formats can be streamed, since they need no encoder state. With MusicGen,
+    ``duration`` (seconds) switches to long-form mode, which generates and sends
+    the track window by window.
+    """
+    if duration is not None and duration <= 0:
+        raise HTTPException(status_code=422, detail="duration must be positive")
+    print(f"Received streaming prompt: {prompt} ({format})")
+    return StreamingResponse(
+        stream_music(prompt, format, polyphonic, duration),
+        media_type="audio/wav",
+        headers={"Cache-Control": "no-store"},
+    )
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Report MusicGen warm-up. Requests are served (by the fallback) meanwhile,
+    but this stays 503 until loading has finished one way or the other."""
+    body = {
+        "musicgen": model_state,
+        "backend": "musicgen" if use_musicgen() else "fallback",
+    }
+    if model_error:
+        body["error"] = model_error
+    if model_state == "loading":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/stats")
+async def stats():
+    return {
+        "note_cache": note_cache.stats(),
+        "generation_pool": generation_pool.stats(),
+        "musicgen_batcher": musicgen_batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "enhancement_cache": enhancement_cache.stats(),
+        "melody_cache": melody_cache.stats(),
+        "worker_pool": worker_pool.stats(),
+        "jobs": job_manager.stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
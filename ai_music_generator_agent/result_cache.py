@@ -0,0 +1,181 @@
+"""Content-addressed cache of generated clips with a size/count-capped LRU"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def normalize_prompt(prompt):
+    """Lower-case and collapse whitespace so trivially different prompts share a key."""
+    return " ".join(prompt.lower().split())
+
+
+class ResultCache:
+    """Generated audio files named by a hash of everything that determines them.
+
+    Files live in ``directory`` (served under /static/generated) as
+    ``<key><suffix>``. An LRU index of ``{filename, bytes, last_used}`` is kept
+    in memory and saved to ``index_path`` so it survives restarts. Once the
+    directory grows past ``max_bytes`` or ``max_files``, the least recently
+    used clips are deleted.
+    """
+
+    def __init__(self, directory, index_path, max_bytes, max_files):
+        self.directory = directory
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = {}
+        self._bytes = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(*parts):
+        payload = json.dumps([str(part) for part in parts], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+
+        # Drop entries whose file has gone missing since the index was saved
+        for key, entry in entries.items():
+            path = os.path.join(self.directory, entry["filename"])
+            if os.path.exists(path):
+                self._entries[key] = entry
+
+        # Adopt clips that aren't in the index (e.g. from before the cache
+        # existed) so they count towards the cap and can be evicted too
+        indexed = {entry["filename"] for entry in self._entries.values()}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name in indexed or name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            self._entries[os.path.splitext(name)[0]] = {
+                "filename": name,
+                "bytes": stat.st_size,
+                "last_used": stat.st_mtime,
+            }
+
+        self._bytes = sum(entry["bytes"] for entry in self._entries.values())
+        with self._lock:
+            self._evict()
+            self._save()
+
+    def lookup(self, key):
+        """Return the cached filename for ``key`` (marking it used) or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not os.path.exists(os.path.join(self.directory, entry["filename"])):
+                self._bytes -= entry["bytes"]
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self._dirty = True
+            self.hits += 1
+            return entry["filename"]
+
+    def store(self, key, write, suffix=".wav"):
+        """Write a clip via ``write(path)`` and add it to the cache; returns its filename.
+
+        ``write`` targets a temporary file that is renamed into place, so
+        concurrent requests for the same key never see a half-written clip.
+        """
+        tmp_path = self.new_temp_path(suffix)
+        try:
+            write(tmp_path)
+        except BaseException:
+            self.discard_temp(tmp_path)
+            raise
+        return self.add(key, tmp_path, suffix)
+
+    def new_temp_path(self, suffix=".wav"):
+        """Reserve a hidden temporary file in the cache directory to write a clip into."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=suffix)
+        os.close(fd)
+        return tmp_path
+
+    def discard_temp(self, tmp_path):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def add(self, key, tmp_path, suffix=".wav"):
+        """Move a finished temporary file into place as ``key``'s clip; returns its filename."""
+        filename = f"{key}{suffix}"
+        path = os.path.join(self.directory, filename)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._bytes -= previous["bytes"]
+            self._entries[key] = {"filename": filename, "bytes": size, "last_used": time.time()}
+            self._bytes += size
+            self._evict(keep=key)
+            self._save()
+        return filename
+
+    def _evict(self, keep=None):
+        # Caller holds the lock
+        if len(self._entries) <= self.max_files and self._bytes <= self.max_bytes:
+            return
+        by_age = sorted(self._entries, key=lambda k: self._entries[k]["last_used"])
+        for key in by_age:
+            if len(self._entries) <= self.max_files and self._bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            entry = self._entries.pop(key)
+            self._bytes -= entry["bytes"]
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, entry["filename"]))
+            except OSError:
+                pass
+        self._dirty = True
+
+    def _save(self):
+        # Caller holds the lock. Written atomically so a crash can't leave a
+        # truncated index behind.
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".index-", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def flush(self):
+        """Persist last-used times recorded by cache hits."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "files": len(self._entries),
+                "bytes": self._bytes,
+                "max_files": self.max_files,
+                "max_bytes": self.max_bytes,
+            }
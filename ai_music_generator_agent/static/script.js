@@ -1,6 +1,10 @@
 const messagesContainer = document.getElementById('messages');
 const promptInput = document.getElementById('promptInput');
 const sendBtn = document.getElementById('sendBtn');
+const formatSelect = document.getElementById('formatSelect');
+const polyphonicToggle = document.getElementById('polyphonicToggle');
+
+const FILE_EXTENSIONS = { wav: 'wav', wav16: 'wav', flac: 'flac', opus: 'ogg' };
 
 function addMessage(text, sender, isHtml = false) {
   const messageDiv = document.createElement('div');
@@ -42,18 +46,83 @@ function addLoading() {
   return loadingDiv;
 }
 
+const STAGE_LABELS = {
+  queued: 'Queued…',
+  enhancing: 'Enhancing your prompt…',
+  composing: 'Composing…',
+  generating: 'Generating audio…',
+  rendering: 'Rendering audio…',
+};
+
+function setLoadingStatus(loadingDiv, job) {
+  let status = loadingDiv.querySelector('.job-status');
+  if (!status) {
+    status = document.createElement('div');
+    status.className = 'job-status';
+    loadingDiv.querySelector('.content').appendChild(status);
+  }
+  const label = STAGE_LABELS[job.stage] || job.stage;
+  status.textContent = `${label} ${Math.round(job.progress * 100)}%`;
+}
+
+// Follow a job over Server-Sent Events, falling back to polling if the
+// connection can't be kept open. Resolves with the final job snapshot and
+// rejects if polling fails.
+function waitForJob(job, onUpdate) {
+  return new Promise((resolve, reject) => {
+    let polling = false;
+
+    const poll = async () => {
+      try {
+        const response = await fetch(job.status_url);
+        if (!response.ok) {
+          throw new Error(`Lost track of the job (HTTP ${response.status})`);
+        }
+        const snapshot = await response.json();
+        onUpdate(snapshot);
+        if (snapshot.status === 'done' || snapshot.status === 'failed') {
+          resolve(snapshot);
+        } else {
+          setTimeout(poll, 1000);
+        }
+      } catch (error) {
+        reject(error);
+      }
+    };
+
+    const events = new EventSource(job.events_url);
+    events.onmessage = (event) => {
+      const snapshot = JSON.parse(event.data);
+      onUpdate(snapshot);
+      if (snapshot.status === 'done' || snapshot.status === 'failed') {
+        events.close();
+        resolve(snapshot);
+      }
+    };
+    events.onerror = () => {
+      events.close();
+      if (!polling) {
+        polling = true;
+        poll();
+      }
+    };
+  });
+}
+
 async function generateMusic(prompt) {
   const loadingMsg = addLoading();
   sendBtn.disabled = true;
   promptInput.disabled = true;
+  const format = formatSelect.value;
+  const polyphonic = polyphonicToggle.checked;
 
   try {
-    const response = await fetch('/generate', {
+    const response = await fetch('/jobs', {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ prompt: prompt }),
+      body: JSON.stringify({ prompt: prompt, format: format, polyphonic: polyphonic }),
     });
 
     if (!response.ok) {
@@ -61,17 +130,22 @@ async function generateMusic(prompt) {
       throw new Error(errorData.detail || 'Failed to generate music');
     }
 
-    const data = await response.json();
+    const job = await waitForJob(await response.json(), (snapshot) => setLoadingStatus(loadingMsg, snapshot));
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Failed to generate music');
+    }
+
+    const data = job.result;
     loadingMsg.remove();
 
     const resultHtml = `
             <p>${data.message}</p>
             <div class="audio-card">
                 <audio controls>
-                    <source src="${data.audio_url}" type="audio/wav">
+                    <source src="${data.audio_url}" type="${data.mime_type}">
                     Your browser does not support the audio element.
                 </audio>
-                <a href="${data.audio_url}" download="generated_music.wav" class="download-btn">
+                <a href="${data.audio_url}" download="generated_music.${FILE_EXTENSIONS[data.format]}" class="download-btn">
                     <i class="fa-solid fa-download"></i> Download
                 </a>
             </div>
@@ -0,0 +1,161 @@
+"""Static file serving with content ETags, long-lived caching and precompressed text assets"""
+import gzip
+import hashlib
+import os
+import threading
+from mimetypes import guess_type
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+# Generated clips are named by a hash of everything that determines them, so
+# a URL never starts pointing at different music
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Front-end files keep their names across edits: cache them, but check the
+# ETag on every use (a 304 when nothing changed)
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+COMPRESSIBLE_SUFFIXES = (".html", ".js", ".css", ".svg", ".json", ".txt")
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+def _brotli():
+    # Optional dependency: without it only gzip variants are built
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def precompress(directory, exclude=()):
+    """Write ``.gz`` (and, with ``brotli`` installed, ``.br``) next to each text asset.
+
+    Variants are only rebuilt when the source is newer, and only kept when
+    they are actually smaller. Returns the number of files written.
+    """
+    brotli = _brotli()
+    compressors = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors[".br"] = lambda data: brotli.compress(data, quality=11)
+
+    written = 0
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in exclude]
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            source = os.path.join(root, name)
+            source_mtime = os.stat(source).st_mtime
+            data = None
+            for suffix, compress in compressors.items():
+                target = source + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime >= source_mtime:
+                    continue
+                if data is None:
+                    with open(source, "rb") as f:
+                        data = f.read()
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    if os.path.exists(target):
+                        os.remove(target)
+                    continue
+                tmp_path = target + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, target)
+                written += 1
+    return written
+
+
+def accepted_encodings(header):
+    """Codings from an Accept-Encoding header that the client accepts (q > 0)."""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+class CachingStaticFiles(StaticFiles):
+    """``StaticFiles`` tuned for repeat visits and seeking in ``<audio>``.
+
+    - ETags are a hash of the file's bytes (computed once per file version),
+      so they are strong validators: ``If-None-Match`` gives 304s and
+      ``If-Range`` lets a player resume or seek with byte ranges. Range and
+      206 handling itself comes from Starlette's ``FileResponse``.
+    - Files under ``immutable_prefix`` are cached for a year without
+      revalidation; everything else must revalidate (``no-cache``).
+    - Text assets are served from ``.br``/``.gz`` siblings built by
+      ``precompress`` when the client accepts that encoding.
+    """
+
+    def __init__(self, *args, immutable_prefix="generated/", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable_prefix = immutable_prefix
+        self._etags = {}  # path -> (mtime_ns, size, etag)
+        self._lock = threading.Lock()
+
+    def content_etag(self, path, stat_result):
+        with self._lock:
+            cached = self._etags.get(path)
+        if cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        etag = f'"{digest.hexdigest()[:32]}"'
+        with self._lock:
+            self._etags[path] = (stat_result.st_mtime_ns, stat_result.st_size, etag)
+        return etag
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        path = str(full_path)
+        relative = os.path.relpath(os.path.realpath(path), os.path.realpath(self.directory))
+        headers = {}
+        media_type = None
+
+        if relative.replace(os.sep, "/").startswith(self.immutable_prefix):
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+
+        if path.endswith(COMPRESSIBLE_SUFFIXES):
+            headers["vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for coding, suffix in ENCODINGS.items():
+                if coding not in accepted:
+                    continue
+                try:
+                    variant_stat = os.stat(path + suffix)
+                except OSError:
+                    continue
+                if variant_stat.st_mtime < stat_result.st_mtime:
+                    continue  # stale; the source changed since precompress ran
+                headers["content-encoding"] = coding
+                # Keep the original media type rather than application/gzip
+                media_type = guess_type(path)[0]
+                path += suffix
+                stat_result = variant_stat
+                break
+
+        headers["etag"] = self.content_etag(path, stat_result)
+        response = FileResponse(
+            path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,382 @@
+"""Fallback synthesizer: monophonic melodies and multi-voice compositions"""
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Cap note duration to avoid hanging
+MAX_NOTE_DURATION = 2.0
+# ...and whole compositions, since voices are rendered in full
+MAX_COMPOSITION_SECONDS = 120.0
+
+
+def adsr_envelope(total_samples):
+    """Simple ADSR envelope: 10% attack, 10% decay, 70% sustain level, 20% release."""
+    attack = int(0.1 * total_samples)
+    decay = int(0.1 * total_samples)
+    release = int(0.2 * total_samples)
+    sustain = total_samples - attack - decay - release
+
+    # Fill the segments in place instead of concatenating four arrays per note
+    envelope = np.empty(total_samples)
+    envelope[:attack] = np.linspace(0, 1, attack)
+    envelope[attack:attack + decay] = np.linspace(1, 0.7, decay)
+    envelope[attack + decay:attack + decay + sustain] = 0.7
+    envelope[attack + decay + sustain:] = np.linspace(0.7, 0, release)
+    return envelope
+
+
+def render_note(out, frequency, duration, ramp=None):
+    """Render one enveloped note into ``out``; its length sets the sample count.
+
+    ``ramp`` is an optional shared ``np.arange`` at least ``len(out)`` long so
+    callers rendering many notes don't rebuild the time axis every time.
+    """
+    total_samples = len(out)
+    if total_samples == 0:
+        return out
+    if ramp is None:
+        ramp = np.arange(total_samples, dtype=np.float64)
+    # Same values as np.linspace(0, duration, total_samples, endpoint=False)
+    t = ramp[:total_samples] * (duration / total_samples)
+
+    # Add some harmonics for a richer sound
+    wave = 0.5 * np.sin(2 * np.pi * frequency * t)
+    wave += 0.2 * np.sin(4 * np.pi * frequency * t) # 2nd harmonic
+    wave += 0.1 * np.sin(6 * np.pi * frequency * t) # 3rd harmonic
+    wave *= adsr_envelope(total_samples)
+
+    out[:] = wave
+    return out
+
+
+def generate_sine_wave(frequency, duration, sample_rate=44100):
+    total_samples = int(sample_rate * duration)
+    return render_note(np.empty(total_samples), frequency, duration)
+
+
+def _number(value, name):
+    # bool is an int, but {"freq": true} is not a pitch
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"Note {name} must be a finite number, not {value!r}")
+    return float(value)
+
+
+def _duration(note):
+    duration = _number(note.get("duration", 0.5), "duration")
+    if duration <= 0:
+        raise ValueError(f"Note duration must be positive, not {duration!r}")
+    return min(duration, MAX_NOTE_DURATION)
+
+
+def parse_note(note):
+    """(frequency, duration) of one of Gemini's note dicts; ValueError if it isn't one."""
+    if not isinstance(note, dict):
+        raise ValueError(f"Note must be an object, not {note!r}")
+    freq = _number(note.get("freq", 440), "freq")
+    if freq < 0:
+        raise ValueError(f"Note freq must not be negative, not {freq!r}")
+    return freq, _duration(note)
+
+
+def parse_chord(note):
+    """(frequencies, duration) of a composition note: a pitch, a chord or a rest.
+
+    A rest (null or 0) gives no frequencies. Raises ValueError like ``parse_note``.
+    """
+    if not isinstance(note, dict):
+        raise ValueError(f"Note must be an object, not {note!r}")
+    pitches = note.get("freq")
+    if not isinstance(pitches, list):
+        pitches = [pitches]
+    freqs = [_number(pitch, "freq") for pitch in pitches if pitch is not None]
+    if any(freq < 0 for freq in freqs):
+        raise ValueError(f"Note freq must not be negative, not {note.get('freq')!r}")
+    if "velocity" in note:
+        _number(note["velocity"], "velocity")
+    return [freq for freq in freqs if freq], _duration(note)
+
+
+def parse_melody(melody):
+    """Turn Gemini's note dicts into (frequencies, durations) lists."""
+    freqs = []
+    durations = []
+    for note in melody:
+        freq, duration = parse_note(note)
+        freqs.append(freq)
+        durations.append(duration)
+    return freqs, durations
+
+
+class NoteCache:
+    """Memory-capped LRU of rendered notes keyed by (frequency, duration, sample_rate).
+
+    Gemini melodies keep reusing the same handful of pitches and durations, so
+    most notes on repeated /generate traffic are copied from here rather than
+    synthesized again. Buffers are float32 (what ends up in the clip) and
+    read-only, since the same array is handed to every caller.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._notes = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, frequency, duration, sample_rate, ramp=None):
+        key = (frequency, duration, sample_rate)
+        with self._lock:
+            note = self._notes.get(key)
+            if note is not None:
+                self._notes.move_to_end(key)
+                self.hits += 1
+                return note
+            self.misses += 1
+
+        note = np.empty(int(sample_rate * duration), dtype=np.float32)
+        render_note(note, frequency, duration, ramp)
+        note.flags.writeable = False
+
+        with self._lock:
+            if key not in self._notes and note.nbytes <= self.max_bytes:
+                self._notes[key] = note
+                self._bytes += note.nbytes
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._notes.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+        return note
+
+    def clear(self):
+        with self._lock:
+            self._notes.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._notes),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def render_melody(melody, sample_rate=44100, cache=None):
+    """Render a monophonic melody into a single preallocated float32 buffer.
+
+    Note lengths are known up front, so each note is written straight into its
+    slice of the output rather than growing the clip one concatenate at a time.
+    Repeated notes come out of ``cache`` (a ``NoteCache``) when one is given.
+    """
+    freqs, durations = parse_melody(melody)
+    lengths = [int(sample_rate * duration) for duration in durations]
+
+    audio = np.empty(sum(lengths), dtype=np.float32)
+    ramp = np.arange(max(lengths, default=0), dtype=np.float64)
+
+    offset = 0
+    for freq, duration, length in zip(freqs, durations, lengths):
+        if cache is not None:
+            audio[offset:offset + length] = cache.get(freq, duration, sample_rate, ramp)
+        else:
+            render_note(audio[offset:offset + length], freq, duration, ramp)
+        offset += length
+
+    return audio
+
+
+def iter_melody(melody, sample_rate=44100, cache=None):
+    """Yield each note of ``melody`` as a float32 buffer, in playback order.
+
+    ``melody`` can also be a generator of note dicts (e.g. fed by a streaming
+    Gemini reply), in which case each note is rendered as soon as it arrives.
+    """
+    ramp = None
+    if isinstance(melody, list):
+        # All lengths are known up front, so the notes can share a time axis
+        _, durations = parse_melody(melody)
+        ramp = np.arange(max((int(sample_rate * d) for d in durations), default=0), dtype=np.float64)
+    for note in melody:
+        freq, duration = parse_note(note)
+        if cache is not None:
+            yield cache.get(freq, duration, sample_rate, ramp)
+        else:
+            buffer = np.empty(int(sample_rate * duration), dtype=np.float32)
+            yield render_note(buffer, freq, duration, ramp)
+
+
+# Polyphonic compositions
+#
+# A composition is {"voices": [voice, ...]} where each voice is
+#   {"name": "bass", "timbre": "bass", "gain": 0.8, "notes": [note, ...]}
+# and each note is {"freq": 110.0 | [261.63, 329.63, 392.0] | null, "duration": 0.5}.
+# A list of frequencies is a chord, null (or 0) is a rest, and an optional
+# "velocity" (0-1) scales a single note. Notes within a voice play back to
+# back; voices play at the same time. A bare list of notes is a plain
+# monophonic melody.
+
+# timbre -> (harmonic amplitudes, (attack, decay, release) as fractions of
+# the note, sustain level, default voice gain)
+TIMBRES = {
+    "lead": ((0.5, 0.2, 0.1), (0.1, 0.1, 0.2), 0.7, 0.7),
+    "bass": ((0.6, 0.25, 0.1, 0.05), (0.02, 0.15, 0.1), 0.6, 0.8),
+    "pad": ((0.35, 0.15, 0.08, 0.04), (0.35, 0.1, 0.3), 0.8, 0.45),
+    "pluck": ((0.5, 0.3, 0.15, 0.08), (0.01, 0.5, 0.3), 0.2, 0.6),
+}
+TIMBRE_NAMES = list(TIMBRES)
+HARMONICS = np.array(
+    [list(h) + [0.0] * (4 - len(h)) for h, _, _, _ in TIMBRES.values()]
+)
+ENVELOPES = np.array([shape for _, shape, _, _ in TIMBRES.values()])
+SUSTAIN_LEVELS = np.array([level for _, _, level, _ in TIMBRES.values()])
+
+# Upper bound on note samples rendered per vectorized block, which keeps the
+# per-sample temporaries at a few tens of MB however long the piece is
+RENDER_BLOCK_SAMPLES = 1 << 20
+# Peak level after soft clipping and normalization (about -1 dBFS)
+MASTER_PEAK = 0.89
+
+
+def composition_events(composition, sample_rate=44100):
+    """Flatten a composition into per-note arrays, sorted by start sample.
+
+    Returns a dict of equal-length arrays: ``start``, ``length``, ``freq``,
+    ``gain`` and ``timbre`` (an index into ``TIMBRE_NAMES``). Chord tones become
+    separate events sharing a start; rests only advance their voice's clock.
+    """
+    if isinstance(composition, list):
+        composition = {"voices": [{"name": "lead", "notes": composition}]}
+    max_samples = int(MAX_COMPOSITION_SECONDS * sample_rate)
+
+    starts, lengths, freqs, gains, timbres = [], [], [], [], []
+    for voice in composition.get("voices", []):
+        name = str(voice.get("name", "lead")).lower()
+        timbre = str(voice.get("timbre", name if name in TIMBRES else "lead")).lower()
+        if timbre not in TIMBRES:
+            timbre = "lead"
+        timbre_id = TIMBRE_NAMES.index(timbre)
+        voice_gain = float(voice.get("gain", TIMBRES[timbre][3]))
+
+        clock = 0
+        for note in voice.get("notes", []):
+            pitches, duration = parse_chord(note)
+            length = int(sample_rate * duration)
+            if clock + length > max_samples:
+                break
+            if pitches:
+                # Keep a chord about as loud as a single note
+                gain = voice_gain * float(note.get("velocity", 1.0)) / np.sqrt(len(pitches))
+                for pitch in pitches:
+                    starts.append(clock)
+                    lengths.append(length)
+                    freqs.append(pitch)
+                    gains.append(gain)
+                    timbres.append(timbre_id)
+            clock += length
+
+    order = np.argsort(np.array(starts, dtype=np.int64), kind="stable")
+    return {
+        "start": np.array(starts, dtype=np.int64)[order],
+        "length": np.array(lengths, dtype=np.int64)[order],
+        "freq": np.array(freqs, dtype=np.float64)[order],
+        "gain": np.array(gains, dtype=np.float64)[order],
+        "timbre": np.array(timbres, dtype=np.int64)[order],
+    }
+
+
+def _render_events(events, sample_rate):
+    """Render a batch of events in one vectorized pass.
+
+    Returns (positions, samples): every sample of every note paired with its
+    position on the shared timeline, ready to be summed with ``np.bincount``.
+    """
+    lengths = events["length"]
+    event = np.repeat(np.arange(len(lengths)), lengths)
+    first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    j = np.arange(len(event)) - first  # sample index within its own note
+    timbre = events["timbre"][event]
+
+    phase = (2 * np.pi / sample_rate) * events["freq"][event] * j
+    wave = np.zeros(len(event))
+    for h in range(HARMONICS.shape[1]):
+        amplitude = HARMONICS[timbre, h]
+        if amplitude.any():
+            wave += amplitude * np.sin((h + 1) * phase)
+
+    # Piecewise-linear ADSR per sample, with segment lengths per note
+    n = lengths[event]
+    shape = ENVELOPES[events["timbre"]]
+    attack = (shape[:, 0] * lengths).astype(np.int64)[event]
+    decay = (shape[:, 1] * lengths).astype(np.int64)[event]
+    release_start = n - (shape[:, 2] * lengths).astype(np.int64)[event]
+    level = SUSTAIN_LEVELS[timbre]
+    envelope = np.where(
+        j < attack,
+        j / np.maximum(attack - 1, 1),
+        np.where(
+            j < attack + decay,
+            1 + (level - 1) * (j - attack) / np.maximum(decay - 1, 1),
+            np.where(
+                j < release_start,
+                level,
+                level * (1 - (j - release_start) / np.maximum(n - release_start - 1, 1)),
+            ),
+        ),
+    )
+
+    wave *= envelope
+    wave *= events["gain"][event]
+    return events["start"][event] + j, wave
+
+
+def master(mix, num_voices):
+    """Soft-clip the summed voices with tanh, then normalize the peak in place."""
+    mix *= 1 / np.sqrt(max(num_voices, 1))
+    np.tanh(mix, out=mix)
+    peak = np.max(np.abs(mix)) if len(mix) else 0.0
+    if peak > 0:
+        mix *= MASTER_PEAK / peak
+    return mix
+
+
+def render_composition(composition, sample_rate=44100, cache=None):
+    """Render a (possibly polyphonic) composition to a float32 buffer.
+
+    Every note of every voice is synthesized together: events are cut into
+    blocks of roughly ``RENDER_BLOCK_SAMPLES`` note samples, each block is
+    rendered in one vectorized pass and accumulated onto the shared timeline
+    with ``np.bincount``. There is no Python loop over voices or notes.
+    """
+    if isinstance(composition, list):
+        return render_melody(composition, sample_rate, cache)
+
+    events = composition_events(composition, sample_rate)
+    if len(events["start"]) == 0:
+        return np.zeros(0, dtype=np.float32)
+    ends = events["start"] + events["length"]
+    mix = np.zeros(int(ends.max()))
+
+    # Split points so each block holds about RENDER_BLOCK_SAMPLES note samples
+    cumulative = np.cumsum(events["length"])
+    cuts = np.searchsorted(cumulative, np.arange(RENDER_BLOCK_SAMPLES, cumulative[-1], RENDER_BLOCK_SAMPLES))
+    bounds = [0, *np.unique(cuts + 1).tolist(), len(cumulative)]
+    for lo, hi in zip(bounds, bounds[1:]):
+        if lo >= hi:
+            continue
+        block = {key: values[lo:hi] for key, values in events.items()}
+        positions, wave = _render_events(block, sample_rate)
+        # Events are sorted by start, so each block only touches a window
+        offset = int(block["start"].min())
+        window = int(ends[lo:hi].max()) - offset
+        mix[offset:offset + window] += np.bincount(positions - offset, weights=wave, minlength=window)
+
+    num_voices = len(composition.get("voices", []))
+    return master(mix, num_voices).astype(np.float32)
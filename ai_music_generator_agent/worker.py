@@ -0,0 +1,52 @@
+"""Functions that run inside the job worker processes
+
+This module only pulls in the synthesizer and encoders, so a freshly spawned
+worker doesn't pay for FastAPI, Gemini or torch imports. The MusicGen helpers
+here are called in the web process, which owns the one loaded model.
+"""
+import os
+
+from encoding import encode_audio
+from synth import NoteCache, render_composition
+
+_note_cache = NoteCache(max_bytes=int(float(os.getenv("NOTE_CACHE_MB", "64")) * 1024 * 1024))
+
+
+def musicgen_generate(processor, model, prompts, max_new_tokens):
+    """Run one padded MusicGen ``generate`` call; returns [(audio, sample_rate), ...]."""
+    inputs = processor(
+        text=list(prompts),
+        padding=True,
+        return_tensors="pt",
+    )
+    audio_values = model.generate(**inputs, max_new_tokens=max_new_tokens)
+    sampling_rate = model.config.audio_encoder.sampling_rate
+    return [(audio_values[i, 0].numpy(), sampling_rate) for i in range(len(prompts))]
+
+
+def musicgen_continue(processor, model, prompt, context, max_new_tokens):
+    """Generate one long-form window for ``prompt``, continuing from ``context`` audio.
+
+    Returns the mono waveform, which starts with MusicGen's rendition of
+    ``context`` when one is given.
+    """
+    if context is None:
+        inputs = processor(text=[prompt], padding=True, return_tensors="pt")
+    else:
+        inputs = processor(
+            audio=context,
+            sampling_rate=model.config.audio_encoder.sampling_rate,
+            text=[prompt],
+            padding=True,
+            return_tensors="pt",
+        )
+    audio_values = model.generate(**inputs, max_new_tokens=max_new_tokens)
+    return audio_values[0, 0].numpy()
+
+
+def render_fallback(composition, sample_rate, fmt, path):
+    """Synthesize a melody or composition and encode it to ``path``; returns seconds of audio."""
+    audio = render_composition(composition, sample_rate, _note_cache)
+    encode_audio(path, audio, sample_rate, fmt)
+    return len(audio) / sample_rate
+